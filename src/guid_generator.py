@@ -0,0 +1,106 @@
+import argparse
+import string
+import sys
+from typing import Iterator
+
+import numpy as np
+
+from src.overlap_sketch import hash64, mix64
+from src.random_streams import generator
+from src.userlist_format import GUID_LENGTH
+
+ALPHABET = np.frombuffer((string.ascii_uppercase + string.digits).encode(), dtype=np.uint8)
+
+# 36^13 > 2^64 なので、64bit 整数1つを13桁で表せる
+WORD_DIGITS = 13
+
+CHUNK_SIZE = 1 << 20
+
+# random: 一様な乱数列 (重複は確率的にしか避けられない)
+# dedup: random で生成し、同じ呼び出しの中で重複したものを引き直す
+# counter: (namespace, 通し番号) を全単射で 128bit に写して符号化する
+#          同じ key で namespace が異なれば、分割をまたいでも重複しない
+GUID_MODES = ('random', 'dedup', 'counter')
+
+
+def generate_guids(size: int, rng: np.random.Generator, mode: str = 'random', key: int = 0, namespace: int = 0,
+                   start: int = 0) -> np.ndarray:
+    if mode == 'counter':
+        return counter_guids(np.arange(start, start + size, dtype=np.uint64), key, namespace)
+    if mode == 'dedup':
+        return unique_random_guids(size, rng)
+    return random_guids(size, rng)
+
+
+# 生成した GUID を chunk_size 件ずつ返す (counter では通し番号が続くので、チャンクをまたいでも重複しない)
+def iter_guids(size: int, rng: np.random.Generator, mode: str = 'random', key: int = 0, namespace: int = 0,
+               chunk_size: int = CHUNK_SIZE) -> Iterator[np.ndarray]:
+    for start in range(0, size, chunk_size):
+        yield generate_guids(min(chunk_size, size - start), rng, mode, key, namespace, start)
+
+
+def random_guids(size: int, rng: np.random.Generator) -> np.ndarray:
+    digits = rng.integers(0, len(ALPHABET), (size, GUID_LENGTH), dtype=np.uint8)
+    return ALPHABET[digits].view(f'S{GUID_LENGTH}').ravel()
+
+
+def unique_random_guids(size: int, rng: np.random.Generator) -> np.ndarray:
+    guids = random_guids(size, rng)
+    while True:
+        duplicated = duplicated_indices(guids)
+        if len(duplicated) == 0:
+            return guids
+        guids[duplicated] = random_guids(len(duplicated), rng)
+
+
+# 2回目以降に現れる GUID の位置 (64bit ハッシュが一致したものだけを文字列で比べる)
+def duplicated_indices(guids: np.ndarray) -> np.ndarray:
+    hashes = hash64(guids)
+    order = np.argsort(hashes)
+    same = hashes[order][1:] == hashes[order][:-1]
+    candidates = np.unique(np.concatenate((order[1:][same], order[:-1][same])))
+    if len(candidates) == 0:
+        return candidates
+    _, first = np.unique(guids[candidates], return_index=True)
+    return np.setdiff1d(candidates, candidates[first])
+
+
+# 下位: low = mix(counter ^ key) は counter について全単射
+# 上位: high = mix(namespace ^ mix(low ^ key')) は low を固定すると namespace について全単射
+# よって (namespace, counter) から (high, low) への写像は単射になる
+# 各語を13桁に符号化するため、1文字目と14文字目は A - D のいずれかになる
+def counter_guids(counters: np.ndarray, key: int = 0, namespace: int = 0) -> np.ndarray:
+    with np.errstate(over='ignore'):
+        key = np.uint64(key & 0xFFFFFFFFFFFFFFFF)
+        low = mix64(counters.astype(np.uint64) ^ key)
+        high = mix64(np.uint64(namespace) ^ mix64(low ^ mix64(key)))
+
+    digits = np.concatenate((base36_digits(high), base36_digits(low)), axis=1)
+    return ALPHABET[digits].view(f'S{GUID_LENGTH}').ravel()
+
+
+def base36_digits(words: np.ndarray) -> np.ndarray:
+    digits = np.empty((len(words), WORD_DIGITS), dtype=np.uint8)
+    words = words.copy()
+    for i in range(WORD_DIGITS - 1, -1, -1):
+        digits[:, i] = words % np.uint64(len(ALPHABET))
+        words //= np.uint64(len(ALPHABET))
+    return digits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('size', type=int)
+    parser.add_argument('-m', '--mode', type=str, choices=GUID_MODES, default='counter', help='(default: counter)')
+    parser.add_argument('--namespace', type=int, default=0, help='e.g. split number for counter mode (default: 0)')
+    parser.add_argument('--seed', type=int, help='seed for reproducible runs')
+    args = parser.parse_args()
+
+    rng = generator(args.seed)
+    key = int(rng.integers(2 ** 63))
+    for guids in iter_guids(args.size, rng, args.mode, key, args.namespace):
+        sys.stdout.buffer.write(b'\n'.join(guids.tolist()) + b'\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import argparse
+from os import remove, replace
+from os.path import getsize
+from typing import Optional
+
+import numpy as np
+
+from src.random_streams import Seed, generator
+
+BLOCK_SIZE = 1 << 22
+NEWLINE = ord('\n')
+
+
+# ファイルの行を1回の走査で抽出する
+# 件数指定 (既定): 全 total_count 行から round(rate * total_count) 行を等確率で非復元抽出する
+#   ブロックごとに、そのブロックから選ばれる行数を超幾何分布から引き、ブロック内で一様に選ぶ
+# bernoulli=True: 各行を独立に rate の確率で抽出する
+# 抽出した行は元の順序のままバイト列として書き出し、書き出した行数を返す
+# total_count を渡した場合は走査しながら行数と照合し、一致しなければ書き出し先を残さずに ValueError を送出する
+def sample_lines(src_file, dest_file, sampling_rate: float, total_count: Optional[int] = None,
+                 bernoulli: bool = False, seed: Seed = None, block_size: int = BLOCK_SIZE) -> int:
+    rng = generator(seed)
+    data = map_file(src_file)
+
+    if not bernoulli and total_count is None:
+        total_count = sum(len(ends) for _, ends in iter_line_blocks(data, block_size))
+    remaining_lines = total_count
+    remaining_sample = None if bernoulli else round(sampling_rate * total_count)
+
+    sampled = 0
+    temp_file = f'{dest_file}.tmp'
+    try:
+        with open(temp_file, 'wb') as dest:
+            for starts, ends in iter_line_blocks(data, block_size):
+                if bernoulli:
+                    selected = np.flatnonzero(rng.random(len(starts)) < sampling_rate)
+                else:
+                    if remaining_lines < len(starts):
+                        raise ValueError(f'{src_file} has more lines than total_count {total_count}')
+                    selected = select_exact(rng, len(starts), remaining_lines, remaining_sample)
+                    remaining_lines -= len(starts)
+                    remaining_sample -= len(selected)
+
+                if len(selected):
+                    dest.write(gather(data, starts[selected], ends[selected]).tobytes())
+                    sampled += len(selected)
+
+        if not bernoulli and remaining_lines:
+            raise ValueError(f'{src_file} has {total_count - remaining_lines} lines, but total_count is {total_count}')
+    except BaseException:
+        remove(temp_file)
+        raise
+
+    replace(temp_file, dest_file)
+    return sampled
+
+
+# 残り remaining 行から残り sample 行を選ぶときに、続く size 行の中から選ぶ行の位置
+def select_exact(rng: np.random.Generator, size: int, remaining: int, sample: int) -> np.ndarray:
+    count = rng.hypergeometric(size, remaining - size, sample) if sample else 0
+    return np.sort(rng.choice(size, count, replace=False))
+
+
+def map_file(path) -> np.ndarray:
+    return np.memmap(path, dtype=np.uint8, mode='r') if 0 < getsize(path) else np.zeros(0, dtype=np.uint8)
+
+
+# 行の区切りで揃えたブロックごとに、各行の先頭と末尾 (改行の次) のバイト位置を返す
+def iter_line_blocks(data: np.ndarray, block_size: int = BLOCK_SIZE):
+    size = len(data)
+    start = 0
+    while start < size:
+        stop = min(start + block_size, size)
+        ends = np.flatnonzero(data[start:stop] == NEWLINE) + start + 1
+        if stop == size and (len(ends) == 0 or ends[-1] != size):
+            # 末尾に改行のない行
+            ends = np.append(ends, size)
+        if len(ends) == 0:
+            # ブロックより長い行
+            block_size *= 2
+            continue
+        yield np.concatenate(([start], ends[:-1])), ends
+        start = int(ends[-1])
+
+
+# 複数のバイト範囲 [starts, ends) を連結した配列
+def gather(data: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    return data[np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('src', type=str)
+    parser.add_argument('dest', type=str)
+    parser.add_argument('-r', '--sampling-rate', type=float, default=0.1, help='(default: 0.1)')
+    parser.add_argument('--bernoulli', action='store_true', help='keep each line independently with the rate')
+    parser.add_argument('--seed', type=int, help='seed for reproducible runs')
+    args = parser.parse_args()
+
+    print(f'sampled: {sample_lines(args.src, args.dest, args.sampling_rate, None, args.bernoulli, args.seed)}')
+
+
+if __name__ == '__main__':
+    main()
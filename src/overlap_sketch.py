@@ -0,0 +1,171 @@
+import argparse
+import math
+from itertools import islice
+from typing import Iterable, List, Sequence
+
+import numpy as np
+
+from src.sampling_simulator_util import CardinalityN, intersection_sizes, print_result_n, region_sizes
+
+MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+# splitmix64 による64bitハッシュ (整数はそのまま、文字列・バイト列は8バイトずつ畳み込む)
+def hash64(values, salt: int = 0) -> np.ndarray:
+    values = np.asarray(values)
+    if values.dtype.kind == 'U':
+        values = values.astype(f'S{max(1, values.dtype.itemsize // 4)}')
+
+    with np.errstate(over='ignore'):
+        if values.dtype.kind in 'iu':
+            return mix64(values.astype(np.uint64) ^ mix64(np.uint64(salt)))
+
+        width = values.dtype.itemsize
+        words = np.zeros((len(values), -(-width // 8) * 8), dtype=np.uint8)
+        words[:, :width] = values.view(np.uint8).reshape(-1, width)
+        hashes = np.full(len(values), mix64(np.uint64(salt)), dtype=np.uint64)
+        for word in words.view(np.uint64).T:
+            hashes = mix64(hashes ^ word)
+        return hashes
+
+
+# splitmix64 の最終化関数 (2^64 上の全単射)
+def mix64(x):
+    x = (x + np.uint64(0x9E3779B97F4A7C15)) & MASK64
+    x = ((x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)) & MASK64
+    x = ((x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)) & MASK64
+    return x ^ (x >> np.uint64(31))
+
+
+# K-minimum values: ハッシュ値の小さい方から k 個を保持する
+class KMVSketch:
+    def __init__(self, k: int, hashes: Sequence[int] = ()):
+        self.k = k
+        self.values = np.unique(np.asarray(hashes, dtype=np.uint64))[:k]
+
+    def update(self, hashes: np.ndarray):
+        self.values = np.unique(np.concatenate((self.values, np.asarray(hashes, dtype=np.uint64))))[:self.k]
+
+    def union(self, *others: 'KMVSketch') -> 'KMVSketch':
+        return KMVSketch(self.k, np.concatenate([self.values] + [other.values for other in others]))
+
+    def estimate(self) -> float:
+        if len(self.values) < self.k:
+            return float(len(self.values))
+        return (self.k - 1) / ((float(self.values[-1]) + 1) / 2 ** 64)
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.k * 8
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = 12, hashes: Sequence[int] = ()):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+        self.update(np.asarray(hashes, dtype=np.uint64))
+
+    def update(self, hashes: np.ndarray):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        rest = (hashes << p) & MASK64
+
+        # 残りのビット列の先頭の0の数 + 1 (32bitずつに分けて float の指数部からビット長を得る)
+        high, low = (rest >> np.uint64(32)).astype(np.float64), (rest & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        leading_zeros = np.where(0 < high, 32 - np.frexp(high)[1], 64 - np.frexp(low)[1])
+        rank = np.minimum(leading_zeros, 64 - self.precision) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def union(self, *others: 'HyperLogLog') -> 'HyperLogLog':
+        merged = HyperLogLog(self.precision)
+        merged.registers = np.maximum.reduce([self.registers] + [other.registers for other in others])
+        return merged
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(np.float64))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and 0 < zeros:
+            return m * math.log(m / zeros)
+        return float(estimate)
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.registers)
+
+
+# 各リストのスケッチから、ビットマスク m のリストすべてに含まれる要素数を推定する (sizes[0] は和集合の要素数)
+def sketch_intersection_sizes(sketches: List) -> np.ndarray:
+    n_lists = len(sketches)
+    unions = np.zeros(1 << n_lists)
+    sizes = np.zeros(1 << n_lists)
+
+    for mask in range(1, 1 << n_lists):
+        members = [sketch for k, sketch in enumerate(sketches) if mask >> k & 1]
+        union = members[0].union(*members[1:])
+        unions[mask] = union.estimate()
+
+        # KMV は和集合のスケッチのうち全リストのスケッチに現れる割合から直接推定する
+        if isinstance(union, KMVSketch) and len(union.values):
+            contained = np.logical_and.reduce([np.isin(union.values, sketch.values) for sketch in members])
+            sizes[mask] = unions[mask] * contained.mean()
+
+    if not isinstance(sketches[0], KMVSketch):
+        # 包除原理: |∩S| = Σ_{∅≠T⊆S} (-1)^(|T|+1) |∪T|
+        for mask in range(1, 1 << n_lists):
+            subsets = [t for t in range(1, mask + 1) if t & mask == t]
+            sizes[mask] = sum((-1) ** (bin(t).count('1') + 1) * unions[t] for t in subsets)
+
+    sizes[0] = unions[-1]
+    return sizes
+
+
+def sketch_cardinality(sketches: List) -> CardinalityN:
+    # 推定誤差で負になった領域は0に切り詰める
+    regions = np.maximum(region_sizes(sketch_intersection_sizes(sketches), len(sketches)), 0)
+    return CardinalityN(intersection_sizes(regions, len(sketches)))
+
+
+def build_sketches(element_lists: Iterable[np.ndarray], factory, salt: int = 0) -> List:
+    sketches = []
+    for elements in element_lists:
+        sketch = factory()
+        sketch.update(hash64(elements, salt))
+        sketches.append(sketch)
+    return sketches
+
+
+def membership_lists(membership: np.ndarray, n_lists: int) -> List[np.ndarray]:
+    return [np.flatnonzero(membership & (1 << k)) for k in range(n_lists)]
+
+
+# userlist の TSV (1列目が GUID) を chunk_lines 行ずつ読みながらスケッチを作る
+def sketch_tsv(path: str, factory, salt: int = 0, chunk_lines: int = 1 << 20):
+    sketch = factory()
+    with open(path, 'rb') as src:
+        while True:
+            lines = list(islice(src, chunk_lines))
+            if not lines:
+                break
+            sketch.update(hash64(np.array([line.split(b'\t', 1)[0].rstrip(b'\r\n') for line in lines]), salt))
+    return sketch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', type=str, nargs='+', help='userlist TSV files (GUID in the first column)')
+    parser.add_argument('-k', '--kmv', type=int, help='use K-minimum values sketches of this size')
+    parser.add_argument('-p', '--hll-precision', type=int, default=14,
+                        help='HyperLogLog precision bits unless --kmv is given (default: 14)')
+    args = parser.parse_args()
+
+    def factory():
+        return KMVSketch(args.kmv) if args.kmv else HyperLogLog(args.hll_precision)
+
+    print_result_n('estimated', sketch_cardinality([sketch_tsv(path, factory) for path in args.files]))
+
+
+if __name__ == '__main__':
+    main()
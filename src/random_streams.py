@@ -0,0 +1,23 @@
+from typing import List, Union
+
+import numpy as np
+
+# 乱数の種: 整数 / SeedSequence / Generator / None (OSのエントロピーから生成)
+Seed = Union[None, int, np.random.SeedSequence, np.random.Generator]
+
+
+def generator(seed: Seed = None) -> np.random.Generator:
+    return seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+
+
+# ワーカーやバッチごとに互いに独立な乱数列の種を n 個作る (同じ種からは同じ順で同じ列が得られる)
+def spawn_seeds(seed: Seed, n: int) -> List[np.random.SeedSequence]:
+    if isinstance(seed, np.random.Generator):
+        seed = seed.bit_generator.seed_seq
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return seed.spawn(n)
+
+
+def python_seed(seed: Seed) -> int:
+    return int(generator(seed).integers(2 ** 63))
@@ -0,0 +1,93 @@
+import json
+import sys
+from typing import Dict, List, Tuple
+
+# コマンドラインでの確率の並び (最後の1つは省略でき、省略時は残りを割り当てる)
+PROBABILITY_NAMES = {
+    2: ('p1', 'p2', 'p12'),
+    3: ('p1', 'p2', 'p3', 'p12', 'p13', 'p23', 'p123'),
+}
+
+
+def add_probability_arguments(parser, n_lists: int = 3):
+    names = PROBABILITY_NAMES[n_lists]
+    for name in names[:-1]:
+        parser.add_argument(name, type=float)
+    parser.add_argument(names[-1], type=float, nargs='?')
+
+
+# 率のグリッドを並列に評価して表に書き出すドライバー (sampling_driver / sampling_driver_2) に共通の引数
+def add_sweep_arguments(parser):
+    parser.add_argument('-o', '--output', type=str,
+                        help='run the grid in parallel and write the results to this CSV/NPZ file')
+    parser.add_argument('-w', '--max-workers', type=int, default=1, help='(default: 1)')
+    parser.add_argument('--coupled', action='store_true',
+                        help='evaluate every sampling rate from one random draw (requires --output)')
+    parser.add_argument('--seed', type=int, help='seed for reproducible runs')
+
+
+def check_sweep_arguments(args):
+    if args.coupled and args.output is None:
+        print('--coupled requires --output', file=sys.stderr)
+        exit(-1)
+
+
+# 引数の並びのまま、合計が1になるように揃えた確率を返す
+def probabilities_from_args(args, n_lists: int = 3) -> Tuple[float, ...]:
+    return normalize_probabilities([getattr(args, name) for name in PROBABILITY_NAMES[n_lists]])
+
+
+def normalize_probabilities(values) -> Tuple[float, ...]:
+    values = list(values)
+    if values[-1] is None:
+        rest = round(1 - sum(values[:-1]), 9)
+        if rest < 0:
+            print('the sum of params exceeds 1', file=sys.stderr)
+            exit(-1)
+        return (*values[:-1], rest)
+
+    total = sum(values)
+    return tuple(value / total for value in values)
+
+
+def region_mask(label: str) -> int:
+    return sum(1 << (int(digit) - 1) for digit in label.lstrip('p'))
+
+
+# シナリオファイル (JSON) を読み込み、確率ベクトル × 母集団サイズの組ごとの設定に展開する
+# {"lists": 3, "sizes": [1000000], "sampling_rates": [0.1, 0.3, 0.5], "product": true,
+#  "scenarios": [{"name": "even", "p1": 0.1, "p2": 0.1, "p12": 0.2, ...}, ...]}
+# 各シナリオで sizes / sampling_rates / product を上書きできる
+def load_scenarios(path: str) -> List[Dict]:
+    with open(path) as src:
+        spec = json.load(src)
+
+    options = ('sizes', 'sampling_rates', 'product')
+    defaults = {'sizes': [1000000], 'sampling_rates': [0.1, 0.3, 0.5, 0.7, 0.9], 'product': True}
+    defaults.update({key: spec[key] for key in options if key in spec})
+
+    expanded = []
+    for i, scenario in enumerate(spec['scenarios']):
+        settings = dict(defaults, **{key: scenario[key] for key in options if key in scenario})
+        probs = {region_mask(key): float(value) for key, value in scenario.items()
+                 if key.startswith('p') and key[1:].isdigit()}
+        n_lists = spec.get('lists', max(probs).bit_length())
+        if (1 << n_lists) <= max(probs):
+            raise ValueError(f'scenario {i} has regions beyond {n_lists} lists')
+
+        total = sum(probs.values())
+        masks = sorted(probs)
+        for size in settings['sizes']:
+            expanded.append({
+                'name': f'{scenario.get("name", i)}/{size}',
+                'lists': n_lists,
+                'masks': masks,
+                'probs': [probs[mask] / total for mask in masks],
+                'size': int(size),
+                'sampling_rates': settings['sampling_rates'],
+                'product': settings['product'],
+            })
+
+    if len({scenario['lists'] for scenario in expanded}) != 1:
+        raise ValueError('every scenario in a file should have the same number of lists')
+    return expanded
@@ -0,0 +1,52 @@
+import argparse
+import sys
+from importlib import import_module
+
+# サブコマンド: (実装モジュール, 説明)
+# 各モジュールは add_arguments(parser) と run(args) を持つ
+COMMANDS = {
+    'simulate': ('src.sampling_driver', 'separate sampling of 3 lists over the rate grid'),
+    'simulate2': ('src.sampling_driver_2', 'separate sampling of 2 lists over the rate grid'),
+    'separate': ('src.separate_sampling_simulator', 'distribution of the corrected overlaps over many epochs'),
+    'sketch': ('src.sketch_simulator', 'KMV / HyperLogLog sketches compared with sampling'),
+    'userlists': ('src.userlist_generator', 'generate userlist TSV files and their samples'),
+    'batch': ('src.sampling_cli', 'run every scenario of a JSON scenario file in one process pool'),
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    parser = argparse.ArgumentParser(prog='python -m src.sampling_cli')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # 起動を速くするため、指定されたサブコマンドのモジュールだけを読み込む
+    for name, (module, description) in COMMANDS.items():
+        command_parser = subparsers.add_parser(name, help=description, description=description)
+        if argv[:1] == [name]:
+            import_module(module).add_arguments(command_parser)
+
+    args = parser.parse_args(argv)
+    import_module(COMMANDS[args.command][0]).run(args)
+
+
+def add_arguments(parser):
+    parser.add_argument('scenarios', type=str, help='JSON scenario file')
+    parser.add_argument('-o', '--output', type=str, required=True, help='CSV/NPZ file to write the results to')
+    parser.add_argument('-w', '--max-workers', type=int, default=1, help='(default: 1)')
+    parser.add_argument('--coupled', action='store_true',
+                        help='evaluate every combination of sampling rates from one random draw per scenario')
+    parser.add_argument('--seed', type=int, help='seed for reproducible runs')
+
+
+def run(args):
+    from src.sampling_args import load_scenarios
+    from src.sampling_sweep import run_batch, write_table
+
+    scenarios = load_scenarios(args.scenarios)
+    print(f'scenarios: {len(scenarios)}, max workers: {args.max_workers}')
+    write_table(run_batch(scenarios, args.max_workers, args.coupled, args.seed), args.output)
+
+
+if __name__ == '__main__':
+    main()
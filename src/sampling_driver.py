@@ -1,52 +1,62 @@
 import argparse
 import itertools
-import sys
-from random import choices
+import random
 
 import numpy as np
 
+from src.random_streams import Seed, python_seed, spawn_seeds
+from src.sampling_args import add_probability_arguments, add_sweep_arguments, check_sweep_arguments, \
+    probabilities_from_args
 from src.sampling_simulator import simulate
-from src.sampling_simulator_util import array
+from src.sampling_simulator_util import generate_membership, membership_to_sets
+from src.sampling_sweep import product_grid, run_coupled_sweep, run_sweep, write_table
+from src.stage_timer import stage
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('p1', type=float)
-    parser.add_argument('p2', type=float)
-    parser.add_argument('p3', type=float)
-    parser.add_argument('p12', type=float)
-    parser.add_argument('p13', type=float)
-    parser.add_argument('p23', type=float)
-    parser.add_argument('p123', type=float, nargs='?')
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+def add_arguments(parser):
+    add_probability_arguments(parser, 3)
     parser.add_argument('-n', '--total-size', type=int, default=1000000, help='(default: 1000000)')
-    args = parser.parse_args()
-
-    if args.p123 is None:
-        p1, p2, p3, p12, p13, p23 = args.p1, args.p2, args.p3, args.p12, args.p13, args.p23
-        p123 = round(1 - sum((p1, p2, p3, p12, p13, p23)), 9)
-        if p12 < 0:
-            print('the sum of params exceeds 1', file=sys.stderr)
-            exit(-1)
-    else:
-        orig = array(args.p1, args.p2, args.p3, args.p12, args.p13, args.p23, args.p123)
-        p1, p2, p3, p12, p13, p23, p123 = orig / orig.sum()
+    add_sweep_arguments(parser)
+
+
+def run(args):
+    check_sweep_arguments(args)
+
+    p1, p2, p3, p12, p13, p23, p123 = probabilities_from_args(args, 3)
 
     print(f'p1: {p1}, p2: {p2}, p3: {p3}, p12: {p12}, p13: {p13}, p23: {p23}, p123: {p123}')
 
-    set1, set2, set3 = generate_testsets(p1, p2, p3, p12, p13, p23, p123, args.total_size)
+    population_seed, sampling_seed = spawn_seeds(args.seed, 2)
+
+    if args.output is not None:
+        membership = generate_membership((p1, p2, p3, p12, p13, p23, p123), args.total_size, seed=population_seed)
+        sampling_rates = np.arange(0.1, 1, 0.2)
+        if args.coupled:
+            table = run_coupled_sweep(membership, 3, sampling_rates, seed=sampling_seed)
+        else:
+            table = run_sweep(membership, 3, product_grid(sampling_rates, 3), args.max_workers, seed=sampling_seed)
+        write_table(table, args.output)
+        return
+
+    # 集合ベースのシミュレーションは random モジュールを使うので、そちらの種も揃える
+    random.seed(python_seed(sampling_seed))
+
+    set1, set2, set3 = generate_testsets(p1, p2, p3, p12, p13, p23, p123, args.total_size, population_seed)
 
     run_simulations(set1, set2, set3)
 
 
-def generate_testsets(p1, p2, p3, p12, p13, p23, p123, total_size):
-    sets = (set(), set(), set())
-    for i in range(total_size):
-        for targets in choices(([0], [1], [2], [0, 1], [0, 2], [1, 2], [0, 1, 2]), (p1, p2, p3, p12, p13, p23, p123)):
-            for target in targets:
-                sets[target].add(i)
-    return sets
+def generate_testsets(p1, p2, p3, p12, p13, p23, p123, total_size, seed: Seed = None):
+    return membership_to_sets(generate_membership((p1, p2, p3, p12, p13, p23, p123), total_size, seed=seed))
 
 
+@stage()
 def run_simulations(set1, set2, set3):
     for sampling_rate1, sampling_rate2, sampling_rate3 \
             in itertools.product(np.arange(0.1, 1, 0.2), np.arange(0.1, 1, 0.2), np.arange(0.1, 1, 0.2)):
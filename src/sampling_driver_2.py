@@ -1,37 +1,59 @@
 import argparse
 import itertools
-import sys
+import random
 
 import numpy as np
 
+from src.random_streams import python_seed
+from src.sampling_args import add_probability_arguments, add_sweep_arguments, check_sweep_arguments, \
+    probabilities_from_args
 from src.sampling_simulator_2 import simulate
 from src.sampling_simulator_util import array
+from src.sampling_sweep import product_grid, run_coupled_sweep, run_sweep, write_table
+from src.stage_timer import stage
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('p1', type=float)
-    parser.add_argument('p2', type=float)
-    parser.add_argument('p12', type=float, nargs='?')
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+def add_arguments(parser):
+    add_probability_arguments(parser, 2)
     parser.add_argument('-n', '--total-size', type=int, default=1000000, help='(default: 1000000)')
-    args = parser.parse_args()
-
-    if args.p12 is None:
-        p1 = args.p1
-        p2 = args.p2
-        p12 = round(1 - p1 - p2, 9)
-        if p12 < 0:
-            print('the sum of params should not exceed 1', file=sys.stderr)
-            exit(-1)
-    else:
-        sum_of_fractions = sum((args.p1, args.p12, args.p2))
-        p1, p12, p2 = array(args.p1, args.p12, args.p2) / sum_of_fractions
+    add_sweep_arguments(parser)
+
+
+def run(args):
+    check_sweep_arguments(args)
+
+    p1, p2, p12 = probabilities_from_args(args, 2)
 
     print(f'p1: {p1}, p12: {p12}, p2: {p2}')
 
+    if args.output is not None:
+        membership = generate_membership2(p1, p12, p2, args.total_size)
+        sampling_rates = np.arange(0.1, 1, 0.2)
+        if args.coupled:
+            table = run_coupled_sweep(membership, 2, sampling_rates, seed=args.seed)
+        else:
+            table = run_sweep(membership, 2, product_grid(sampling_rates, 2), args.max_workers, seed=args.seed)
+        write_table(table, args.output)
+        return
+
+    # 集合ベースのシミュレーションは random モジュールを使うので、そちらの種を揃える
+    random.seed(python_seed(args.seed))
+
     run_simulations(p1, p12, p2, args.total_size)
 
 
+def generate_membership2(p1, p12, p2, total_size):
+    n1, n12, n2 = (round(n) for n in (array(p1, p12, p2) * total_size))
+    return np.repeat(np.array((0b01, 0b11, 0b10), dtype=np.uint8), (n1, n12, n2))
+
+
+@stage()
 def run_simulations(p1, p12, p2, total_size):
     n1, n12, n2 = (round(n) for n in (array(p1, p12, p2) * total_size))
     set1, set2 = set(range(n1 + n12)), set(range(n1, n1 + n12 + n2))
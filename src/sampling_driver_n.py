@@ -0,0 +1,57 @@
+import argparse
+import itertools
+import sys
+
+import numpy as np
+
+from src.random_streams import Seed, spawn_seeds
+from src.sampling_simulator_util import generate_membership, region_labels, simulate_n
+from src.stage_timer import stage
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('lists', type=int, help='number of lists (2 - 8)')
+    parser.add_argument('probs', type=float, nargs='+',
+                        help='fractions of each region in bitmask order (p1 p2 p12 p3 p13 p23 p123 ...)')
+    parser.add_argument('-n', '--total-size', type=int, default=1000000, help='(default: 1000000)')
+    parser.add_argument('-r', '--sampling-rates', type=float, nargs='+', default=[0.1, 0.3, 0.5, 0.7, 0.9],
+                        help='(default: 0.1 0.3 0.5 0.7 0.9)')
+    parser.add_argument('--product', action='store_true',
+                        help='simulate every combination of sampling rates instead of the same rate for all lists')
+    parser.add_argument('--seed', type=int, help='seed for reproducible runs')
+    args = parser.parse_args()
+
+    if not 2 <= args.lists <= 8:
+        print('the number of lists should be between 2 and 8', file=sys.stderr)
+        exit(-1)
+
+    if len(args.probs) != (1 << args.lists) - 1:
+        print(f'{(1 << args.lists) - 1} params are required for {args.lists} lists', file=sys.stderr)
+        exit(-1)
+
+    probs = np.array(args.probs) / sum(args.probs)
+
+    print(', '.join(f'p{label}: {p}' for label, p in zip(region_labels(args.lists), probs)))
+
+    population_seed, sampling_seed = spawn_seeds(args.seed, 2)
+
+    membership = generate_membership(probs, args.total_size, range(1, 1 << args.lists), population_seed)
+
+    run_simulations(membership, args.lists, args.sampling_rates, args.product, sampling_seed)
+
+
+@stage()
+def run_simulations(membership, n_lists, sampling_rates, product=False, seed: Seed = None):
+    grid = list(itertools.product(sampling_rates, repeat=n_lists)) if product \
+        else [(sampling_rate,) * n_lists for sampling_rate in sampling_rates]
+
+    for rates, point_seed in zip(grid, spawn_seeds(seed, len(grid))):
+        print('========================================================================================================'
+              '===')
+        print(f'sampling rate: {" ".join(str(round(rate, 9)) for rate in rates)}')
+        simulate_n(membership, n_lists, rates, point_seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+import numpy as np
+
+from src.random_streams import Seed, generator, spawn_seeds
+from src.shared_population import SharedPopulation, attach
+from src.stage_timer import stage
+
+# 1バッチで確保する (エポック数 x 要素数) 配列の要素数の上限
+BATCH_ELEMENTS = 1 << 23
+
+# numpy の超幾何分布が扱える ngood / nbad の上限
+HYPERGEOMETRIC_LIMIT = 10 ** 9
+
+
+def default_batch_size(population_size: int) -> int:
+    return max(1, BATCH_ELEMENTS // max(1, population_size))
+
+
+# epochs 回分の個別サンプリングを行い、各回の所属ビットマスクごとの要素数を (epochs, 2^n_lists) の配列で返す
+def sample_region_counts(membership: np.ndarray, n_lists: int, sampling_rates, epochs: int,
+                         batch_size: Optional[int] = None, max_workers: int = 1,
+                         bernoulli: bool = False, seed: Seed = None) -> np.ndarray:
+    batches = tuple(iter_region_count_batches(membership, n_lists, sampling_rates, epochs,
+                                              batch_size, max_workers, bernoulli, seed))
+    return np.concatenate(batches) if batches else np.zeros((0, 1 << n_lists), dtype=np.int64)
+
+
+def iter_region_count_batches(membership: np.ndarray, n_lists: int, sampling_rates, epochs: int,
+                              batch_size: Optional[int] = None, max_workers: int = 1,
+                              bernoulli: bool = False, seed: Seed = None,
+                              population: Optional[SharedPopulation] = None,
+                              executor: Optional[ProcessPoolExecutor] = None) -> Iterator[np.ndarray]:
+    sampling_rates = tuple(np.broadcast_to(np.asarray(sampling_rates, dtype=float), (n_lists,)).tolist())
+    batch_size = batch_size or default_batch_size(len(membership))
+    batch_sizes = [min(batch_size, epochs - start) for start in range(0, epochs, batch_size)]
+
+    # バッチごとに独立な乱数列を割り当てるので、結果はワーカー数によらず種だけで決まる
+    seeds = spawn_seeds(seed, len(batch_sizes))
+
+    # 呼び出し側が共有メモリ上の母集団とプールを渡した場合は、繰り返し呼んでもそれらを使い回す
+    if population is not None and executor is not None:
+        yield from _map_batches(executor, population, n_lists, sampling_rates, batch_sizes, bernoulli, seeds)
+        return
+
+    if max_workers <= 1:
+        for size, batch_seed in zip(batch_sizes, seeds):
+            yield sample_batch(membership, n_lists, sampling_rates, size, bernoulli, batch_seed)
+        return
+
+    # 母集団は共有メモリに一度だけ置き、タスクにはハンドルとパラメータのみを渡す
+    with SharedPopulation(membership) as population, ProcessPoolExecutor(max_workers=max_workers) as executor:
+        yield from _map_batches(executor, population, n_lists, sampling_rates, batch_sizes, bernoulli, seeds)
+
+
+def _map_batches(executor: ProcessPoolExecutor, population: SharedPopulation, n_lists: int, sampling_rates,
+                 batch_sizes, bernoulli: bool, seeds) -> Iterator[np.ndarray]:
+    return executor.map(_sample_batch_in_worker, [(population.handle, n_lists, sampling_rates, size, bernoulli, seed)
+                                                  for size, seed in zip(batch_sizes, seeds)])
+
+
+@stage()
+def sample_batch(membership: np.ndarray, n_lists: int, sampling_rates, batch_size: int,
+                 bernoulli: bool = False, seed: Seed = None) -> np.ndarray:
+    rng = generator(seed)
+    sampled = np.zeros((batch_size, len(membership)), dtype=membership.dtype)
+    rows = np.arange(batch_size)[:, None]
+
+    for k, sampling_rate in enumerate(sampling_rates):
+        members = np.flatnonzero(membership & (1 << k))
+        keys = rng.random((batch_size, len(members)))
+
+        if bernoulli:
+            picked_rows, picked = np.nonzero(keys < sampling_rate)
+            sampled[picked_rows, members[picked]] |= 1 << k
+            continue
+
+        # random.sample と同じく各回ちょうど round(len * rate) 個を非復元抽出する
+        sample_size = round(len(members) * sampling_rate)
+        if sample_size >= len(members):
+            sampled[:, members] |= 1 << k
+        elif 0 < sample_size:
+            chosen = np.argpartition(keys, sample_size, axis=1)[:, :sample_size]
+            sampled[rows, members[chosen]] |= 1 << k
+
+    return np.stack([np.bincount(row, minlength=1 << n_lists) for row in sampled])
+
+
+# 各リストの要素に一様な順位を1回だけ割り当て、率 r では順位が round(len * r) 未満の要素を抽出したものとする
+# (率の異なるサンプルが入れ子になる). grids[k] の全組み合わせについての重複数を
+# (len(grids[0]), ..., len(grids[n_lists - 1]), 2^n_lists) の配列で返す
+def coupled_intersection_sizes(membership: np.ndarray, n_lists: int, grids, seed: Seed = None) -> np.ndarray:
+    rng = generator(seed)
+    grids = [np.asarray(grid, dtype=float) for grid in ([grids] * n_lists if np.ndim(grids[0]) == 0 else grids)]
+    orders = [np.argsort(grid, kind='stable') for grid in grids]
+    shape = tuple(len(grid) for grid in grids)
+
+    # thresholds[:, k]: リスト k の (昇順に並べた) 率のうち、その要素が抽出される最初の添字 (抽出されなければ len)
+    index = np.zeros(len(membership), dtype=np.int64)
+    for k, (grid, order) in enumerate(zip(grids, orders)):
+        members = np.flatnonzero(membership & (1 << k))
+        sample_sizes = np.array([round(len(members) * rate) for rate in grid[order]])
+        thresholds = np.full(len(membership), len(grid), dtype=np.int64)
+        thresholds[members] = np.searchsorted(sample_sizes, rng.permutation(len(members)), side='right')
+        index = index * (len(grid) + 1) + thresholds
+
+    # cumulative[j]: 各リスト k で昇順 j_k 番目の率のときに抽出される要素数 (添字 len はそのリストを問わない)
+    cumulative = np.bincount(index, minlength=int(np.prod([n + 1 for n in shape]))).reshape([n + 1 for n in shape])
+    for axis in range(n_lists):
+        cumulative = np.cumsum(cumulative, axis=axis)
+
+    sizes = np.empty(shape + (1 << n_lists,), dtype=np.int64)
+    for mask in range(1 << n_lists):
+        selector = tuple(slice(0, n) if mask >> k & 1 else slice(n, n + 1) for k, n in enumerate(shape))
+        sizes[..., mask] = cumulative[selector]
+
+    # 率の並びを入力の順に戻す
+    return sizes[np.ix_(*[np.argsort(order) for order in orders])]
+
+
+# 母集団の各領域の要素数 regions (長さ 2^n_lists, index はビットマスク) だけから、
+# 個別サンプリングした結果の領域ごとの要素数を epochs 回分 (epochs, 2^n_lists) の配列で直接引く
+def draw_region_counts(regions, n_lists: int, sampling_rates, epochs: int,
+                       batch_size: Optional[int] = None, bernoulli: bool = False, seed: Seed = None) -> np.ndarray:
+    batches = tuple(iter_drawn_batches(regions, n_lists, sampling_rates, epochs, batch_size, bernoulli, seed))
+    return np.concatenate(batches) if batches else np.zeros((0, 1 << n_lists), dtype=np.int64)
+
+
+def iter_drawn_batches(regions, n_lists: int, sampling_rates, epochs: int, batch_size: Optional[int] = None,
+                       bernoulli: bool = False, seed: Seed = None) -> Iterator[np.ndarray]:
+    regions = np.asarray(regions, dtype=np.int64)
+    sampling_rates = tuple(np.broadcast_to(np.asarray(sampling_rates, dtype=float), (n_lists,)).tolist())
+    batch_size = batch_size or max(1, BATCH_ELEMENTS // (1 << 2 * n_lists))
+    batch_sizes = [min(batch_size, epochs - start) for start in range(0, epochs, batch_size)]
+
+    for size, batch_seed in zip(batch_sizes, spawn_seeds(seed, len(batch_sizes))):
+        yield draw_batch(regions, n_lists, sampling_rates, size, bernoulli, generator(batch_seed))
+
+
+@stage()
+def draw_batch(regions: np.ndarray, n_lists: int, sampling_rates, batch_size: int, bernoulli: bool,
+               rng: np.random.Generator) -> np.ndarray:
+    # cells[:, r, p]: 領域 r の要素のうち、ここまでのリストで p のビットのリストにだけ抽出された要素数
+    cells = np.zeros((batch_size, 1 << n_lists, 1 << n_lists), dtype=np.int64)
+    cells[:, np.arange(1 << n_lists), 0] = regions
+
+    for k, sampling_rate in enumerate(sampling_rates):
+        bit = 1 << k
+        targets = [r for r in range(1 << n_lists) if r & bit]
+
+        if bernoulli:
+            picks = {r: None for r in targets}
+        else:
+            # リスト k からちょうど round(len * rate) 個を非復元抽出したときの各領域からの抽出数
+            sample_size = round(regions[targets].sum() * sampling_rate)
+            picks = dict(zip(targets, _multivariate_hypergeometric(
+                rng, np.broadcast_to(regions[targets], (batch_size, len(targets))),
+                np.full(batch_size, sample_size), axis=1).T))
+
+        for r, picked in picks.items():
+            patterns = [p for p in range(bit) if p & r == p]
+            current = cells[:, r, patterns]
+            if bernoulli:
+                selected = rng.binomial(current, sampling_rate)
+            else:
+                selected = _multivariate_hypergeometric(rng, current, picked, axis=1)
+            cells[:, r, patterns] -= selected
+            cells[:, r, [p | bit for p in patterns]] += selected
+
+    return cells.sum(axis=1)
+
+
+def _multivariate_hypergeometric(rng: np.random.Generator, colors: np.ndarray, nsample: np.ndarray,
+                                 axis: int) -> np.ndarray:
+    colors = np.moveaxis(np.asarray(colors, dtype=np.int64), axis, -1)
+    remaining_total = colors.sum(axis=-1)
+    remaining_sample = np.array(nsample, dtype=np.int64)
+
+    drawn = np.empty_like(colors)
+    for i in range(colors.shape[-1] - 1):
+        remaining_total = remaining_total - colors[..., i]
+        drawn[..., i] = _hypergeometric(rng, colors[..., i], remaining_total, remaining_sample)
+        remaining_sample = remaining_sample - drawn[..., i]
+    drawn[..., -1] = remaining_sample
+
+    return np.moveaxis(drawn, -1, axis)
+
+
+def _hypergeometric(rng: np.random.Generator, ngood: np.ndarray, nbad: np.ndarray, nsample: np.ndarray) -> np.ndarray:
+    if max(np.max(ngood, initial=0), np.max(nbad, initial=0)) < HYPERGEOMETRIC_LIMIT:
+        return rng.hypergeometric(ngood, nbad, nsample)
+
+    # 10億件を超える場合は有限母集団修正付きの正規近似で代用する
+    total = np.maximum(ngood + nbad, 2)
+    fraction = ngood / total
+    mean = nsample * fraction
+    std = np.sqrt(nsample * fraction * (1 - fraction) * (total - nsample) / (total - 1))
+    drawn = np.rint(rng.normal(mean, std))
+    return np.clip(drawn, np.maximum(0, nsample - nbad), np.minimum(nsample, ngood)).astype(np.int64)
+
+
+def _sample_batch_in_worker(args):
+    handle, *params = args
+    return sample_batch(attach(handle), *params)
@@ -3,8 +3,10 @@ from random import sample
 from typing import Any, Union, Set
 
 from src.sampling_simulator_util import Cardinality3, decompose3, rmse
+from src.stage_timer import stage
 
 
+@stage()
 def simulate(population1: Set[Any], population2: Set[Any], population3: Set[Any], sampling_rate1: float,
              sampling_rate2: Union[float, None] = None, sampling_rate3: Union[float, None] = None):
 
@@ -38,6 +40,7 @@ def simulate(population1: Set[Any], population2: Set[Any], population3: Set[Any]
     print_result('corrected', n_corrected, err_corrected)
 
 
+@stage()
 def print_result(header: str, n: Cardinality3, err: float = math.nan):
     print(f'{header}: n1 = {round(n.v1)}, n2 = {round(n.v2)}, n3 = {round(n.v3)}, n12 = {round(n.v12)}, '
           f'n13 = {round(n.v13)}, n23 = {round(n.v23)}, n123 = {round(n.v123)}, '
@@ -46,6 +49,7 @@ def print_result(header: str, n: Cardinality3, err: float = math.nan):
 
 
 # 個別サンプリング
+@stage()
 def do_sampling(population1: Set[Any], population2: Set[Any], population3: Set[Any],
                 sampling_rate1: float, sampling_rate2: float, sampling_rate3: float) -> Cardinality3:
     sample1 = set(sample(list(population1), round(len(population1) * sampling_rate1)))
@@ -56,6 +60,7 @@ def do_sampling(population1: Set[Any], population2: Set[Any], population3: Set[A
 
 
 # 個別サンプリングの場合の理論値の計算
+@stage()
 def do_estimation(sampling_rate1: float, sampling_rate2: float, sampling_rate3: float, n: Cardinality3) -> Cardinality3:
     # 個別サンプリングの場合の理論値の計算
     # 各サンプリングで選ばれる確率はsampling_rateに等しいので重複する確率はsampling_rateの積となる
@@ -75,6 +80,7 @@ def do_estimation(sampling_rate1: float, sampling_rate2: float, sampling_rate3:
 
 
 # 補正計算
+@stage()
 def do_correction(n_actual: Cardinality3, sampling_rate1: float, sampling_rate2: float,
                   sampling_rate3: float) -> Cardinality3:
 
@@ -3,8 +3,10 @@ from random import sample
 from typing import Any, Union, Set
 
 from src.sampling_simulator_util import decompose2, Cardinality2, rmse
+from src.stage_timer import stage
 
 
+@stage()
 def simulate(population1: Set[Any], population2: Set[Any],
              sampling_rate1: float, sampling_rate2: Union[float, None] = None):
 
@@ -35,21 +37,24 @@ def simulate(population1: Set[Any], population2: Set[Any],
     print_result('corrected', n_corrected, err_corrected)
 
 
+@stage()
 def print_result(header: str, n: Cardinality2, err: float = math.nan):
     print(f'{header}: n1 = {round(n.v1)}, n12 = {round(n.v12)}, n2 = {round(n.v2)}, '
           f'p1 = {n.p1:.4f}, p12 = {n.p12:.4f}, p2 = {n.p2:.4f}, err = {err:.6f}')
 
 
 # 個別サンプリング
+@stage()
 def do_sampling(population1: Set[Any], population2: Set[Any],
                 sampling_rate1: float, sampling_rate2: float) -> Cardinality2:
-    sample1 = set(sample(list(population1), int(len(population1) * sampling_rate1)))
-    sample2 = set(sample(list(population2), int(len(population2) * sampling_rate2)))
+    sample1 = set(sample(list(population1), round(len(population1) * sampling_rate1)))
+    sample2 = set(sample(list(population2), round(len(population2) * sampling_rate2)))
 
     return decompose2(sample1, sample2)
 
 
 # 個別サンプリングの場合の理論値の計算
+@stage()
 def do_estimation(sampling_rate1: float, sampling_rate2: float, n: Cardinality2) -> Cardinality2:
     # 各サンプリングで選ばれる確率はsampling_rateに等しいので重複する確率はsampling_rateの積となる
     # これに母集合の重複数をかけて重複数の期待値を得る
@@ -67,6 +72,7 @@ def do_estimation(sampling_rate1: float, sampling_rate2: float, n: Cardinality2)
 
 
 # 補正計算
+@stage()
 def do_correction(n_actual: Cardinality2, sampling_rate1: float, sampling_rate2: float) -> Cardinality2:
 
     r1 = 1 / sampling_rate1
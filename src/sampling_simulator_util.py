@@ -1,10 +1,40 @@
+import math
+
 import numpy as np
 
+from src.random_streams import Seed, generator
+from src.stage_timer import stage
+
+
+# Cardinality3.values() / Cardinality2.values() の並びに対応する所属ビットマスク
+# (ビット k が立っていれば k + 1 番目のリストに所属する)
+REGION_MASKS2 = (0b01, 0b11, 0b10)
+REGION_MASKS3 = (0b001, 0b010, 0b100, 0b011, 0b101, 0b110, 0b111)
+
+MEMBERSHIP_CHUNK_SIZE = 1 << 22
+
 
 def array(*args):
     return np.array(args)
 
 
+def generate_membership(probs, total_size: int, region_masks=REGION_MASKS3, seed: Seed = None) -> np.ndarray:
+    rng = generator(seed)
+    masks = np.asarray(region_masks, dtype=np.uint8)
+    weights = np.asarray(probs, dtype=float)
+    weights = weights / weights.sum()
+
+    membership = np.empty(total_size, dtype=np.uint8)
+    for start in range(0, total_size, MEMBERSHIP_CHUNK_SIZE):
+        stop = min(start + MEMBERSHIP_CHUNK_SIZE, total_size)
+        membership[start:stop] = masks[rng.choice(len(masks), stop - start, p=weights)]
+    return membership
+
+
+def membership_to_sets(membership: np.ndarray, n_lists: int = 3):
+    return tuple(set(np.flatnonzero(membership & (1 << k)).tolist()) for k in range(n_lists))
+
+
 class Cardinality2:
     def __init__(self, n1: float, n12: float, n2: float):
         self.size1, self.size12, self.size2 = n1, n12, n2
@@ -35,27 +65,223 @@ class Cardinality3:
         return np.array((self.p1, self.p2, self.p3, self.p12, self.p13, self.p23, self.p123))
 
 
+# N個のリストの重複を所属ビットマスクで添字付けした配列で表す
+# sizes[m]: m のビットが立っているリストすべてに含まれる要素数 / v[m]: ちょうど m のリストだけに含まれる要素数
+class CardinalityN:
+    def __init__(self, sizes: np.ndarray):
+        self.sizes = np.asarray(sizes)
+        self.n_lists = len(self.sizes).bit_length() - 1
+        self.v = region_sizes(self.sizes, self.n_lists)
+        self.total_count = self.v[1:].sum()
+
+    def values(self):
+        return self.v[1:]
+
+    def normalized(self):
+        return self.v[1:] / self.total_count
+
+
+def region_labels(n_lists: int):
+    return [''.join(str(k + 1) for k in range(n_lists) if m >> k & 1) for m in range(1, 1 << n_lists)]
+
+
+def as_cardinality_n(n) -> CardinalityN:
+    if isinstance(n, CardinalityN):
+        return n
+    if isinstance(n, Cardinality2):
+        return CardinalityN(np.array((0, n.size1, n.size2, n.size12)))
+    return CardinalityN(np.array((0, n.size1, n.size2, n.size12, n.size3, n.size13, n.size23, n.size123)))
+
+
+# 集合やリストは集合演算のほうが速い (配列への変換のほうが高くつく) ので、NumPy 配列のときだけビットマスクで数える
+@stage()
 def decompose2(population1, population2) -> Cardinality2:
-    intersect = set(population1).intersection(population2)
-    return Cardinality2(len(population1), len(intersect), len(population2))
+    if _all_arrays(population1, population2):
+        return decompose_membership2(membership_of(population1, population2))
 
+    set1, set2 = _as_set(population1), _as_set(population2)
+    return Cardinality2(len(set1), len(set1.intersection(set2)), len(set2))
 
+
+@stage()
 def decompose3(population1, population2, population3) -> Cardinality3:
-    intersect12 = set(population1).intersection(population2)
-    intersect13 = set(population1).intersection(population3)
-    intersect23 = set(population2).intersection(population3)
-    intersect123 = intersect12.intersection(intersect13)
-
-    n123 = len(intersect123)
-    n12 = len(intersect12)
-    n13 = len(intersect13)
-    n23 = len(intersect23)
-    n1 = len(population1)
-    n2 = len(population2)
-    n3 = len(population3)
+    if _all_arrays(population1, population2, population3):
+        return decompose_membership3(membership_of(population1, population2, population3))
+
+    set1, set2, set3 = _as_set(population1), _as_set(population2), _as_set(population3)
+    intersect12 = set1.intersection(set2)
+    intersect13 = set1.intersection(set3)
+    intersect23 = set2.intersection(set3)
+    intersect123 = intersect12.intersection(set3)
+    return Cardinality3(len(set1), len(set2), len(set3), len(intersect12), len(intersect13), len(intersect23),
+                        len(intersect123))
+
+
+def _all_arrays(*populations) -> bool:
+    return all(isinstance(population, np.ndarray) for population in populations)
+
+
+def _as_set(population) -> set:
+    return population if isinstance(population, (set, frozenset)) else set(population)
 
+
+def decompose_membership2(membership: np.ndarray) -> Cardinality2:
+    n1, n2, n12 = intersection_sizes(region_counts(membership, 2), 2)[1:].tolist()
+    return Cardinality2(n1, n12, n2)
+
+
+def decompose_membership3(membership: np.ndarray) -> Cardinality3:
+    n1, n2, n12, n3, n13, n23, n123 = intersection_sizes(region_counts(membership, 3), 3)[1:].tolist()
     return Cardinality3(n1, n2, n3, n12, n13, n23, n123)
 
 
+# 各要素の所属リストをビットマスクで表す
+# 同じリストに重複して現れる要素は1つと数える (ビットは OR で重ねる)
+def membership_of(*populations) -> np.ndarray:
+    dtype = np.min_scalar_type((1 << len(populations)) - 1)
+    kinds = {_element_kind(population) for population in populations if len(population)}
+    if None in kinds or 1 < len(kinds):
+        # 1次元の数値・文字列配列でない入力 (集合、リスト、object 配列など) は辞書で数える
+        return _membership_of_objects(populations, dtype)
+
+    arrays = [population for population in populations if len(population)]
+    elements = np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int64)
+    offsets = np.cumsum([0] + [len(population) for population in populations])
+
+    # 密な非負整数IDならソートせずIDを直接添字にする (どこにも属さないIDはマスク0となる)
+    if elements.dtype.kind in 'iu' and 0 < len(elements) and 0 <= elements.min() \
+            and elements.max() < 4 * len(elements):
+        indices, membership = elements, np.zeros(int(elements.max()) + 1, dtype=dtype)
+    else:
+        uniques, indices = np.unique(elements, return_inverse=True)
+        indices, membership = indices.ravel(), np.zeros(len(uniques), dtype=dtype)
+
+    for bit in range(len(populations)):
+        membership[indices[offsets[bit]:offsets[bit + 1]]] |= dtype.type(1 << bit)
+    return membership
+
+
+# 互いに比較できる要素の種類 (1次元の数値・文字列・バイト列の NumPy 配列以外は None)
+def _element_kind(population):
+    if not isinstance(population, np.ndarray) or population.ndim != 1:
+        return None
+    if population.dtype.kind in 'biuf':
+        return 'number'
+    return population.dtype.kind if population.dtype.kind in 'US' else None
+
+
+def _membership_of_objects(populations, dtype) -> np.ndarray:
+    masks = {}
+    for bit, population in enumerate(populations):
+        for element in population:
+            masks[element] = masks.get(element, 0) | (1 << bit)
+    return np.fromiter(masks.values(), dtype=dtype, count=len(masks))
+
+
+# 所属ビットマスクごとの要素数 (index 0 はどのリストにも属さない要素)
+def region_counts(membership: np.ndarray, n_lists: int) -> np.ndarray:
+    return np.bincount(membership, minlength=1 << n_lists)
+
+
+@stage()
+def decompose(*populations) -> CardinalityN:
+    return decompose_membership(membership_of(*populations), len(populations))
+
+
+@stage()
+def decompose_membership(membership: np.ndarray, n_lists: int) -> CardinalityN:
+    return CardinalityN(intersection_sizes(region_counts(membership, n_lists), n_lists))
+
+
+# ビットマスク m の各リストすべてに含まれる要素数 (上位集合和)
+def intersection_sizes(counts: np.ndarray, n_lists: int) -> np.ndarray:
+    sizes = np.array(counts)
+    for bit in range(n_lists):
+        view = sizes.reshape(sizes.shape[:-1] + (-1, 2, 1 << bit))
+        view[..., 0, :] += view[..., 1, :]
+    return sizes
+
+
+# intersection_sizes の逆変換 (メビウス変換). index 0 はどのリストにも属さない要素なので 0 とする
+def region_sizes(sizes: np.ndarray, n_lists: int) -> np.ndarray:
+    counts = np.array(sizes)
+    for bit in range(n_lists):
+        view = counts.reshape(counts.shape[:-1] + (-1, 2, 1 << bit))
+        view[..., 0, :] -= view[..., 1, :]
+    counts[..., 0] = 0
+    return counts
+
+
+# ビットマスク m の各リストの値の積 (m = 0 は 1)
+def subset_products(values, n_lists: int) -> np.ndarray:
+    values = np.asarray(values, dtype=float)
+    products = np.ones(values.shape[:-1] + (1,))
+    for k in range(n_lists):
+        products = np.concatenate((products, products * values[..., k:k + 1]), axis=-1)
+    return products
+
+
+@stage()
 def rmse(seq1: np.ndarray, seq2: np.ndarray) -> float:
     return np.linalg.norm(seq1 - seq2) / np.sqrt(len(seq1))
+
+
+@stage()
+def simulate_n(membership: np.ndarray, n_lists: int, sampling_rates, seed: Seed = None):
+    sampling_rates = np.broadcast_to(np.asarray(sampling_rates, dtype=float), (n_lists,))
+
+    n = decompose_membership(membership, n_lists)
+
+    # 個別サンプリングの結果を取得する
+    n_actual = do_sampling_n(membership, n_lists, sampling_rates, seed)
+
+    # 個別サンプリングの場合の理論値の計算
+    n_estimated = do_estimation_n(sampling_rates, n)
+
+    # 補正計算
+    n_corrected = do_correction_n(n_actual, sampling_rates)
+
+    # 誤差計算
+    probabilities_expected = n.normalized()
+    err_actual = rmse(n_actual.normalized(), probabilities_expected)
+
+    err_computed = rmse(n_estimated.normalized(), probabilities_expected)
+    err_corrected = rmse(n_corrected.normalized(), probabilities_expected)
+
+    print_result_n('expected ', n)
+    print_result_n('actual   ', n_actual, err_actual)
+    print_result_n('estimated', n_estimated, err_computed)
+    print_result_n('corrected', n_corrected, err_corrected)
+
+
+@stage()
+def print_result_n(header: str, n: CardinalityN, err: float = math.nan):
+    labels = region_labels(n.n_lists)
+    counts = ', '.join(f'n{label} = {round(v)}' for label, v in zip(labels, n.values()))
+    probabilities = ', '.join(f'p{label} = {p:.4f}' for label, p in zip(labels, n.normalized()))
+    print(f'{header}: {counts}, {probabilities}, err = {err:.6f}')
+
+
+# 個別サンプリング
+@stage()
+def do_sampling_n(membership: np.ndarray, n_lists: int, sampling_rates, seed: Seed = None) -> CardinalityN:
+    rng = generator(seed)
+    sampled = np.zeros_like(membership)
+    for k, sampling_rate in enumerate(sampling_rates):
+        members = np.flatnonzero(membership & (1 << k))
+        sampled[rng.choice(members, round(len(members) * sampling_rate), replace=False)] |= 1 << k
+
+    return decompose_membership(sampled, n_lists)
+
+
+# 個別サンプリングの場合の理論値の計算
+# 各サンプリングで選ばれる確率はsampling_rateに等しいので重複する確率はsampling_rateの積となる
+@stage()
+def do_estimation_n(sampling_rates, n: CardinalityN) -> CardinalityN:
+    return CardinalityN(n.sizes * subset_products(sampling_rates, n.n_lists))
+
+
+# 補正計算
+@stage()
+def do_correction_n(n_actual: CardinalityN, sampling_rates) -> CardinalityN:
+    return CardinalityN(n_actual.sizes / subset_products(sampling_rates, n_actual.n_lists))
@@ -0,0 +1,131 @@
+import csv
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from src.random_streams import Seed, spawn_seeds
+from src.sampling_engine import coupled_intersection_sizes
+from src.sampling_simulator_util import CardinalityN, decompose_membership, do_sampling_n, generate_membership, \
+    region_labels, region_sizes, subset_products
+from src.sampling_variance import CorrectionMoments
+from src.shared_population import SharedPopulation, attach
+
+Table = Dict[str, np.ndarray]
+
+
+def product_grid(sampling_rates, n_lists: int) -> np.ndarray:
+    return np.array(list(itertools.product(sampling_rates, repeat=n_lists)), dtype=float)
+
+
+# サンプリング率のグリッド (行: グリッド点, 列: リスト) の各点で個別サンプリングを行い、結果を列ごとの配列にまとめる
+def run_sweep(membership: np.ndarray, n_lists: int, grid, max_workers: int = 1, scenario: str = '',
+              seed: Seed = None) -> Table:
+    grid = np.asarray(grid, dtype=float).reshape(-1, n_lists)
+    seeds = spawn_seeds(seed, len(grid))
+
+    # 母集団の分解はグリッド全体で一度だけ行う
+    n = decompose_membership(membership, n_lists)
+
+    if max_workers <= 1:
+        actual = [do_sampling_n(membership, n_lists, rates, point_seed).sizes
+                  for rates, point_seed in zip(grid, seeds)]
+    else:
+        with SharedPopulation(membership) as population, ProcessPoolExecutor(max_workers=max_workers) as executor:
+            actual = list(executor.map(_sample_in_worker, [(population.handle, n_lists, rates, point_seed)
+                                                           for rates, point_seed in zip(grid, seeds)]))
+
+    return build_table(n, grid, np.array(actual).reshape(len(grid), -1), scenario)
+
+
+# 全グリッド点を1回の乱数割り当てから求める (率をまたいでサンプルが入れ子になる)
+def run_coupled_sweep(membership: np.ndarray, n_lists: int, sampling_rates, scenario: str = '',
+                      seed: Seed = None) -> Table:
+    n = decompose_membership(membership, n_lists)
+    sizes = coupled_intersection_sizes(membership, n_lists, sampling_rates, seed)
+    grid = product_grid(sampling_rates, n_lists)
+    return build_table(n, grid, sizes.reshape(len(grid), -1), scenario)
+
+
+def run_scenarios(scenarios: Iterable[Tuple[str, np.ndarray]], n_lists: int, grid, max_workers: int = 1,
+                  seed: Seed = None) -> Table:
+    scenarios = list(scenarios)
+    return concat_tables([run_sweep(membership, n_lists, grid, max_workers, name, scenario_seed)
+                          for (name, membership), scenario_seed in zip(scenarios, spawn_seeds(seed, len(scenarios)))])
+
+
+# シナリオファイルから読み込んだ設定 (sampling_args.load_scenarios) をまとめて実行する
+# 並列実行はシナリオ単位で行い、1つのプロセスプールを全シナリオで使い回す
+def run_batch(scenarios: List[Dict], max_workers: int = 1, coupled: bool = False, seed: Seed = None) -> Table:
+    jobs = [(scenario, coupled, scenario_seed)
+            for scenario, scenario_seed in zip(scenarios, spawn_seeds(seed, len(scenarios)))]
+    if max_workers <= 1:
+        return concat_tables(map(_run_scenario, jobs))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return concat_tables(executor.map(_run_scenario, jobs))
+
+
+def _run_scenario(args) -> Table:
+    scenario, coupled, seed = args
+    population_seed, sampling_seed = spawn_seeds(seed, 2)
+    n_lists, rates = scenario['lists'], scenario['sampling_rates']
+    membership = generate_membership(scenario['probs'], scenario['size'], scenario['masks'], population_seed)
+
+    # coupled では常に全組み合わせを評価する
+    if coupled:
+        return run_coupled_sweep(membership, n_lists, rates, scenario['name'], sampling_seed)
+    grid = product_grid(rates, n_lists) if scenario['product'] else [(rate,) * n_lists for rate in rates]
+    return run_sweep(membership, n_lists, grid, 1, scenario['name'], sampling_seed)
+
+
+def _sample_in_worker(args):
+    handle, n_lists, rates, seed = args
+    return do_sampling_n(attach(handle), n_lists, rates, seed).sizes
+
+
+def build_table(n: CardinalityN, grid: np.ndarray, actual_sizes: np.ndarray, scenario: str = '') -> Table:
+    n_lists = n.n_lists
+    labels = region_labels(n_lists)
+    products = subset_products(grid, n_lists)
+
+    expected = np.broadcast_to(n.v[1:], (len(grid), len(labels)))
+    results = {
+        'actual': region_sizes(actual_sizes, n_lists)[:, 1:],
+        'estimated': region_sizes(n.sizes * products, n_lists)[:, 1:],
+        'corrected': region_sizes(actual_sizes / products, n_lists)[:, 1:],
+    }
+
+    table = {'scenario': np.full(len(grid), scenario)}
+    table.update({f'rate{k + 1}': grid[:, k] for k in range(n_lists)})
+    table.update({f'expected_n{label}': expected[:, i] for i, label in enumerate(labels)})
+    for name, values in results.items():
+        table.update({f'{name}_n{label}': values[:, i] for i, label in enumerate(labels)})
+
+    # 補正値の理論上の標準偏差
+    corrected_std = CorrectionMoments(n, grid).std()
+    table.update({f'corrected_sd_n{label}': corrected_std[:, i] for i, label in enumerate(labels)})
+
+    probabilities_expected = expected / expected.sum(axis=1, keepdims=True)
+    for name, values in results.items():
+        probabilities = values / values.sum(axis=1, keepdims=True)
+        table[f'err_{name}'] = np.sqrt(np.mean((probabilities - probabilities_expected) ** 2, axis=1))
+
+    return table
+
+
+def concat_tables(tables: Iterable[Table]) -> Table:
+    tables = list(tables)
+    return {column: np.concatenate([table[column] for table in tables]) for column in tables[0]}
+
+
+def write_table(table: Table, path: str):
+    if path.endswith('.npz'):
+        np.savez(path, **table)
+        return
+
+    with open(path, 'w', newline='') as dest:
+        writer = csv.writer(dest)
+        writer.writerow(table.keys())
+        writer.writerows(zip(*(column.tolist() for column in table.values())))
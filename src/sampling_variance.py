@@ -0,0 +1,62 @@
+from statistics import NormalDist
+from typing import Tuple
+
+import numpy as np
+
+from src.sampling_simulator_util import as_cardinality_n, subset_products
+
+
+# 個別サンプリング後に補正した各領域の要素数の期待値と分散 (サンプリング率の配列 (..., n_lists) についてベクトル化)
+# 各リストから round(len * rate) 個を非復元抽出するモデル (bernoulli=True なら各要素を独立に rate で抽出するモデル)
+class CorrectionMoments:
+    def __init__(self, n, sampling_rates, bernoulli: bool = False):
+        n = as_cardinality_n(n)
+        n_lists = n.n_lists
+        sizes = np.asarray(n.sizes, dtype=float)
+        rates = np.asarray(sampling_rates, dtype=float)
+        rates = np.broadcast_to(rates, rates.shape[:-1] + (n_lists,)) if rates.ndim else np.full(n_lists, rates)
+
+        # f: 各要素が抽出される確率, q: 同じリストの異なる2要素がともに抽出される確率
+        list_sizes = sizes[[1 << k for k in range(n_lists)]]
+        if bernoulli:
+            f, q = rates, rates ** 2
+        else:
+            sample_sizes = np.round(list_sizes * rates)
+            f = sample_sizes / list_sizes
+            q = f * (sample_sizes - 1) / np.maximum(list_sizes - 1, 1)
+
+        pf, pq, pr = (subset_products(values, n_lists) for values in (f, q, rates))
+
+        # 抽出された重複数 Y_S の共分散
+        # Cov(Y_S, Y_T) = |S∪T| Πf(S∪T) + (|S||T| - |S∪T|) Πq(S∩T) Πf(S△T) - |S| Πf(S) |T| Πf(T)
+        s, t = np.meshgrid(np.arange(len(sizes)), np.arange(len(sizes)), indexing='ij')
+        union, intersection, difference = s | t, s & t, s ^ t
+        sampled_cov = sizes[union] * pf[..., union] \
+            + (sizes[s] * sizes[t] - sizes[union]) * pq[..., intersection] * pf[..., difference] \
+            - (sizes * pf)[..., s] * (sizes * pf)[..., t]
+
+        # 補正後の重複数 Z_S = Y_S / Πrate(S)
+        size_mean = sizes * pf / pr
+        size_cov = sampled_cov / (pr[..., :, None] * pr[..., None, :])
+
+        mobius = _mobius_matrix(n_lists)
+        self.n_lists = n_lists
+        self.size_mean = size_mean[..., 1:]
+        self.size_variance = np.maximum(np.diagonal(size_cov, axis1=-2, axis2=-1)[..., 1:], 0)
+        self.mean = (size_mean @ mobius.T)[..., 1:]
+        self.variance = np.einsum('rs,...st,rt->...r', mobius, size_cov, mobius)[..., 1:]
+
+    def std(self) -> np.ndarray:
+        return np.sqrt(np.maximum(self.variance, 0))
+
+    def confidence_interval(self, level: float = 0.95) -> Tuple[np.ndarray, np.ndarray]:
+        z = NormalDist().inv_cdf((1 + level) / 2)
+        return self.mean - z * self.std(), self.mean + z * self.std()
+
+
+# 上位集合和の逆変換を行列で表したもの: M[r, s] = (-1)^(|s| - |r|) (r ⊆ s)
+def _mobius_matrix(n_lists: int) -> np.ndarray:
+    r, s = np.meshgrid(np.arange(1 << n_lists), np.arange(1 << n_lists), indexing='ij')
+    parity = np.vectorize(lambda x: bin(x).count('1') % 2)(s ^ r)
+    return np.where(r & s == r, 1 - 2 * parity, 0)
+
@@ -1,50 +1,68 @@
 
 import argparse
-import sys
+import time
 from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from random import sample
-from typing import TypeVar
+from statistics import NormalDist
+from typing import Optional, TypeVar
 
-import matplotlib.pyplot as plt
 import numpy as np
 
-from src.sampling_driver import generate_testsets
-from src.sampling_simulator import do_correction
-from src.sampling_simulator_util import array, Cardinality3
-from src.sampling_simulator_util import decompose3
+from src.random_streams import Seed, spawn_seeds
+from src.sampling_args import add_probability_arguments, probabilities_from_args
+from src.sampling_engine import iter_drawn_batches, iter_region_count_batches
+from src.sampling_simulator_util import Cardinality3, generate_membership, intersection_sizes, subset_products
+from src.sampling_simulator_util import region_counts
+from src.sampling_simulator_util import decompose3, decompose_membership3
+from src.shared_population import SharedPopulation
+from src.stage_timer import stage
+from src.streaming_stats import StreamingStats, print_summary, save_histogram
+
+# 集計する重複領域 (index はビットマスク: 3 = 12, 5 = 13, 6 = 23, 7 = 123)
+CROSS_REGIONS = (('12', 0b011), ('13', 0b101), ('23', 0b110), ('123', 0b111))
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('p1', type=float)
-    parser.add_argument('p2', type=float)
-    parser.add_argument('p3', type=float)
-    parser.add_argument('p12', type=float)
-    parser.add_argument('p13', type=float)
-    parser.add_argument('p23', type=float)
-    parser.add_argument('p123', type=float, nargs='?')
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+def add_arguments(parser):
+    add_probability_arguments(parser, 3)
     parser.add_argument('-n', '--total-size', type=int, default=1000000, help='(default: 1000000)')
-    args = parser.parse_args()
-
-    if args.p123 is None:
-        p1, p2, p3, p12, p13, p23 = args.p1, args.p2, args.p3, args.p12, args.p13, args.p23
-        p123 = round(1 - sum((p1, p2, p3, p12, p13, p23)), 9)
-        if p12 < 0:
-            print('the sum of params exceeds 1', file=sys.stderr)
-            exit(-1)
-    else:
-        orig = array(args.p1, args.p2, args.p3, args.p12, args.p13, args.p23, args.p123)
-        p1, p2, p3, p12, p13, p23, p123 = orig / orig.sum()
+    parser.add_argument('-e', '--epochs', type=int, default=1000,
+                        help='number of epochs, or the upper limit with --precision / --time-budget (default: 1000)')
+    parser.add_argument('-w', '--max-workers', type=int, default=1, help='(default: 1)')
+    parser.add_argument('--population-free', action='store_true',
+                        help='draw sampled region counts from the population counts without sampling elements')
+    parser.add_argument('--seed', type=int, help='seed for reproducible runs')
+    parser.add_argument('--histogram', type=str, default='hist123.png',
+                        help='file to write the histogram of n123 to (default: hist123.png)')
+    parser.add_argument('--precision', type=float,
+                        help='stop once the 95%% CI half-width of every corrected count is within this relative error')
+    parser.add_argument('--time-budget', type=float, help='stop after this many seconds')
+    parser.add_argument('--check-every', type=int, default=100,
+                        help='epochs run between stopping checks (default: 100)')
+
+
+def run(args):
+    p1, p2, p3, p12, p13, p23, p123 = probabilities_from_args(args, 3)
 
     print(f'p1: {p1}, p2: {p2}, p3: {p3}, p12: {p12}, p13: {p13}, p23: {p23}, p123: {p123}')
 
-    set1, set2, set3 = generate_testsets(p1, p2, p3, p12, p13, p23, p123, args.total_size)
+    population_seed, sampling_seed = spawn_seeds(args.seed, 2)
+
+    membership = generate_membership((p1, p2, p3, p12, p13, p23, p123), args.total_size, seed=population_seed)
 
-    c3 = decompose3(set1, set2, set3)
+    c3 = decompose_membership3(membership)
 
     print([c3.size1, c3.size2, c3.size3, c3.size12, c3.size13, c3.size23, c3.size123])
 
-    simulate(set1, set2, set3, 1000)
+    simulate(membership, args.epochs, max_workers=args.max_workers, population_free=args.population_free,
+             seed=sampling_seed, histogram=args.histogram, precision=args.precision, time_budget=args.time_budget,
+             check_every=args.check_every)
 
 
 T = TypeVar('T')
@@ -59,49 +77,63 @@ def pickup_cross_region_elements(set1: set[T], set2: set[T], set3: set[T], sampl
     return decompose3(sample1, sample2, sample3)
 
 
-def f(args):
-    return pickup_cross_region_elements(args[0], args[1], args[2], args[3])
-
-
-def print_summary(data):
-    print(f'mean = {data.mean()}, stddev = {data.std(ddof=1)}, 2.5%ile = {np.percentile(data, 2.5)}, 1Q = {np.percentile(data, 25)},'
-          f' Median = {np.percentile(data, 50)}, 3Q = {np.percentile(data, 75)}, 97.5%ile = {np.percentile(data, 97.5)}')
-
-
-def simulate(set1, set2, set3, epoch: int):
-    sampling_rate = 0.1
-    executor = ProcessPoolExecutor(max_workers=16)
-
-    results = tuple(executor.map(f, [(set1, set2, set3, sampling_rate) for _ in range(epoch)]))
-
-    corrected = [do_correction(r, sampling_rate, sampling_rate, sampling_rate) for r in results]
-
-    cross12 = np.array([r.size12 for r in results])
-    cross12_corrected = np.array([r.size12 for r in corrected])
-    print('12')
-    print_summary(cross12)
-    print_summary(cross12_corrected)
-
-    cross13 = np.array([r.size13 for r in results])
-    cross13_corrected = np.array([r.size13 for r in corrected])
-    print('13')
-    print_summary(cross13)
-    print_summary(cross13_corrected)
-
-    cross23 = np.array([r.size23 for r in results])
-    cross23_corrected = np.array([r.size23 for r in corrected])
-    print('23')
-    print_summary(cross23)
-    print_summary(cross23_corrected)
-
-    cross123 = np.array([r.size123 for r in results])
-    cross123_corrected = np.array([r.size123 for r in corrected])
-    print('123')
-    print_summary(cross123)
-    print_summary(cross123_corrected)
-
-    plt.hist(cross123)
-    plt.show()
+@stage()
+def simulate(membership: np.ndarray, epoch: int, sampling_rate: float = 0.1, max_workers: int = 1,
+             population_free: bool = False, seed: Seed = None, histogram: Optional[str] = None,
+             precision: Optional[float] = None, time_budget: Optional[float] = None, check_every: int = 100,
+             level: float = 0.95) -> int:
+    sampling_rates = (sampling_rate,) * 3
+    indices = [index for _, index in CROSS_REGIONS]
+    scales = subset_products(sampling_rates, 3)[indices]
+
+    # 打ち切りの判定ごとに何度も呼ぶので、共有メモリ上の母集団とプールは最初に一度だけ用意する
+    resources = ExitStack()
+    population = executor = None
+    if not population_free and 1 < max_workers and (precision is not None or time_budget is not None):
+        population = resources.enter_context(SharedPopulation(membership))
+        executor = resources.enter_context(ProcessPoolExecutor(max_workers=max_workers))
+
+    def run(epochs: int, epochs_seed: Seed):
+        if population_free:
+            return iter_drawn_batches(region_counts(membership, 3), 3, sampling_rates, epochs, seed=epochs_seed)
+        return iter_region_count_batches(membership, 3, sampling_rates, epochs, max_workers=max_workers,
+                                         seed=epochs_seed, population=population, executor=executor)
+
+    # 各回の結果は保持せず、バッチごとに重複数と補正値の統計量へ集約する
+    results, corrected = StreamingStats(len(indices)), StreamingStats(len(indices))
+
+    def accumulate(batches):
+        for counts in batches:
+            sizes = intersection_sizes(counts, 3)[:, indices]
+            results.update(sizes)
+            corrected.update(sizes / scales)
+
+    with resources:
+        if precision is None and time_budget is None:
+            accumulate(run(epoch, seed))
+        else:
+            # check_every 回ずつ実行し、補正値の信頼区間が十分狭くなるか時間切れになったら打ち切る
+            z = NormalDist().inv_cdf((1 + level) / 2)
+            started = time.monotonic()
+            round_seeds = spawn_seeds(seed, 1)[0]
+            while corrected.count < epoch:
+                accumulate(run(min(check_every, epoch - corrected.count), spawn_seeds(round_seeds, 1)[0]))
+                half_width = z * corrected.std() / np.sqrt(corrected.count)
+                if precision is not None and np.all(half_width <= precision * np.abs(corrected.mean)):
+                    break
+                if time_budget is not None and time_budget <= time.monotonic() - started:
+                    break
+
+    print(f'epochs: {corrected.count}')
+    for column, (label, _) in enumerate(CROSS_REGIONS):
+        print(label)
+        print_summary(results, column)
+        print_summary(corrected, column)
+
+    if histogram is not None:
+        save_histogram(results.digests[-1], histogram)
+
+    return corrected.count
 
 
 if __name__ == '__main__':
@@ -0,0 +1,49 @@
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+# ワーカーへはこのハンドル (種別, 名前またはパス, shape, dtype) だけを渡す
+Handle = Tuple[str, str, tuple, str]
+
+_attached = {}
+
+
+class SharedPopulation:
+    def __init__(self, array: np.ndarray, path: Optional[str] = None):
+        array = np.ascontiguousarray(array)
+        if path is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            self.array = np.ndarray(array.shape, dtype=array.dtype, buffer=self._shm.buf)
+            self.handle: Handle = ('shm', self._shm.name, array.shape, array.dtype.str)
+        else:
+            self._shm = None
+            self.array = np.lib.format.open_memmap(path, mode='w+', dtype=array.dtype, shape=array.shape)
+            self.handle: Handle = ('file', path, array.shape, array.dtype.str)
+        self.array[...] = array
+        if self._shm is None:
+            self.array.flush()
+
+    def close(self):
+        self.array = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# 同じプロセス内では一度だけアタッチし、以降は同じビューを返す
+def attach(handle: Handle) -> np.ndarray:
+    kind, name, shape, dtype = handle
+    if name not in _attached:
+        if kind == 'shm':
+            shm = shared_memory.SharedMemory(name=name)
+            _attached[name] = (shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf))
+        else:
+            _attached[name] = (None, np.load(name, mmap_mode='r'))
+    return _attached[name][1]
@@ -0,0 +1,79 @@
+import argparse
+
+import numpy as np
+
+from src.overlap_sketch import HyperLogLog, KMVSketch, build_sketches, membership_lists, sketch_cardinality
+from src.random_streams import Seed, generator, spawn_seeds
+from src.sampling_args import add_probability_arguments, probabilities_from_args
+from src.sampling_simulator_util import decompose_membership, do_correction_n, do_sampling_n, generate_membership, \
+    region_labels, rmse
+
+KMV_SIZES = (256, 1024, 4096, 16384)
+HLL_PRECISIONS = (8, 10, 12, 14)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+def add_arguments(parser):
+    add_probability_arguments(parser, 3)
+    parser.add_argument('-n', '--total-size', type=int, default=1000000, help='(default: 1000000)')
+    parser.add_argument('-t', '--trials', type=int, default=20, help='(default: 20)')
+    parser.add_argument('--seed', type=int, help='seed for reproducible runs')
+
+
+def run(args):
+    p1, p2, p3, p12, p13, p23, p123 = probabilities_from_args(args, 3)
+
+    print(f'p1: {p1}, p2: {p2}, p3: {p3}, p12: {p12}, p13: {p13}, p23: {p23}, p123: {p123}')
+
+    population_seed, sketch_seed = spawn_seeds(args.seed, 2)
+    membership = generate_membership((p1, p2, p3, p12, p13, p23, p123), args.total_size, seed=population_seed)
+
+    simulate(membership, 3, args.trials, sketch_seed)
+
+
+# スケッチごとに、同じメモリ量で個別サンプリング + 補正を行った場合と誤差を比べる
+def simulate(membership: np.ndarray, n_lists: int, trials: int, seed: Seed = None):
+    n = decompose_membership(membership, n_lists)
+    lists = membership_lists(membership, n_lists)
+    configs = [(f'kmv k={k}', lambda k=k: KMVSketch(k)) for k in KMV_SIZES] \
+        + [(f'hll p={p}', lambda p=p: HyperLogLog(p)) for p in HLL_PRECISIONS]
+
+    for (name, factory), config_seed in zip(configs, spawn_seeds(seed, len(configs))):
+        rng = generator(config_seed)
+        memory = factory().memory_bytes
+
+        estimates = [sketch_cardinality(build_sketches(lists, factory, int(rng.integers(2 ** 63))))
+                     for _ in range(trials)]
+        print_errors(f'{name:<12}', memory, n, estimates)
+
+        # 1要素8バイトのIDを保持するとして、同じメモリ量で抽出できる率で個別サンプリングする
+        rates = [min(1.0, memory / (8 * len(elements))) for elements in lists]
+        corrected = [do_correction_n(do_sampling_n(membership, n_lists, rates, rng), rates) for _ in range(trials)]
+        print_errors(f'{"sampling":<12}', memory, n, corrected)
+
+
+def print_errors(header: str, memory: int, n, estimates):
+    err = np.mean([rmse(estimate.normalized(), n.normalized()) for estimate in estimates])
+    sizes = np.array([estimate.sizes for estimate in estimates])
+
+    # 2つ以上のリストの重複数の相対 RMSE (真の値が 0 の重複は相対誤差が定まらないので絶対 RMSE)
+    masks = [mask for mask in range(1, 1 << n.n_lists) if 1 < bin(mask).count('1')]
+    labels = region_labels(n.n_lists)
+    errors = []
+    for mask in masks:
+        true_size = n.sizes[mask]
+        if true_size:
+            errors.append(f'size{labels[mask - 1]} = {np.sqrt(np.mean((sizes[:, mask] / true_size - 1) ** 2)):.4f}')
+        else:
+            errors.append(f'size{labels[mask - 1]} = {np.sqrt(np.mean(sizes[:, mask] ** 2)):.1f} (absolute)')
+    crosses = ', '.join(errors)
+    print(f'{header}: memory = {memory} B/list, err = {err:.6f}, relative rmse: {crosses}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from functools import wraps
+from glob import glob
+from multiprocessing import util
+from typing import Dict, List
+
+# SAMPLING_STAGE_TIMER=1 で終了時に表を標準エラー出力へ、SAMPLING_STAGE_TIMER=<path>.json で JSON に書き出す
+# 未設定なら stage はデコレートした関数をそのまま返すので、計測のコストはかからない
+ENV = 'SAMPLING_STAGE_TIMER'
+DIR_ENV = 'SAMPLING_STAGE_TIMER_DIR'
+OWNER_ENV = 'SAMPLING_STAGE_TIMER_OWNER'
+
+_setting = os.environ.get(ENV, '')
+_enabled = _setting not in ('', '0')
+
+# ステージ名: [呼び出し回数, 経過時間, CPU時間]
+_stats: Dict[str, List[float]] = {}
+
+
+def stage(name: str = None):
+    def decorator(func):
+        if not _enabled:
+            return func
+
+        stage_name = name or f'{_module_name(func).rsplit(".", 1)[-1]}.{func.__qualname__}'
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started, cpu_started = time.perf_counter(), time.process_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record = _stats.setdefault(stage_name, [0, 0.0, 0.0])
+                record[0] += 1
+                record[1] += time.perf_counter() - started
+                record[2] += time.process_time() - cpu_started
+
+        return wrapper
+
+    return decorator
+
+
+# python -m で実行したモジュールは __main__ ではなく元のモジュール名で集計する
+def _module_name(func) -> str:
+    spec = getattr(sys.modules.get(func.__module__), '__spec__', None)
+    return spec.name if func.__module__ == '__main__' and spec is not None else func.__module__
+
+
+def merge_stats(stats: Dict[str, List[float]], other: Dict[str, List[float]]):
+    for stage_name, (calls, wall, cpu) in other.items():
+        record = stats.setdefault(stage_name, [0, 0.0, 0.0])
+        record[0] += calls
+        record[1] += wall
+        record[2] += cpu
+
+
+def format_table(stats: Dict[str, List[float]]) -> str:
+    lines = [f'{"stage":<40} {"calls":>8} {"wall s":>10} {"cpu s":>10} {"wall ms/call":>13}']
+    for stage_name, (calls, wall, cpu) in sorted(stats.items(), key=lambda item: -item[1][1]):
+        lines.append(f'{stage_name:<40} {calls:>8} {wall:>10.4f} {cpu:>10.4f} {1000 * wall / calls:>13.4f}')
+    return '\n'.join(lines)
+
+
+def _report():
+    if os.environ.get(OWNER_ENV) != str(os.getpid()):
+        # ワーカープロセスは自分の集計をファイルに残し、親プロセスが終了時にまとめる
+        if _stats:
+            with open(f'{os.environ[DIR_ENV]}/stage-{os.getpid()}.json', 'w') as dest:
+                json.dump(_stats, dest)
+        return
+
+    stats = {}
+    merge_stats(stats, _stats)
+    for path in glob(f'{os.environ[DIR_ENV]}/stage-*.json'):
+        with open(path) as src:
+            merge_stats(stats, json.load(src))
+    shutil.rmtree(os.environ[DIR_ENV], ignore_errors=True)
+
+    if _setting.endswith('.json'):
+        with open(_setting, 'w') as dest:
+            json.dump({stage_name: {'calls': calls, 'wall_seconds': wall, 'cpu_seconds': cpu}
+                       for stage_name, (calls, wall, cpu) in stats.items()}, dest, indent=2)
+    elif stats:
+        print(format_table(stats), file=sys.stderr)
+
+
+# atexit はマルチプロセスのワーカーでは呼ばれないため、multiprocessing の終了処理に登録する
+def _start(*_):
+    _stats.clear()
+    util.Finalize(None, _report, exitpriority=0)
+
+
+class _ForkHook:
+    pass
+
+
+if _enabled:
+    if DIR_ENV not in os.environ:
+        os.environ[DIR_ENV] = tempfile.mkdtemp(prefix='stage-timer-')
+        os.environ[OWNER_ENV] = str(os.getpid())
+    _start()
+    # fork したワーカーは親の集計と終了処理を引き継がないようにやり直す
+    _fork_hook = _ForkHook()
+    util.register_after_fork(_fork_hook, _start)
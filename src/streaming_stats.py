@@ -0,0 +1,136 @@
+import math
+from typing import Optional, Sequence
+
+import numpy as np
+
+SUMMARY_QUANTILES = (2.5, 25, 50, 75, 97.5)
+
+
+# 列ごとの件数・平均・分散 (Welford / Chan の方法) と分位点 (t-digest) を逐次的に集計する
+# 集計結果はワーカーごとに作って merge で結合できる
+class StreamingStats:
+    def __init__(self, columns: int, compression: float = 200):
+        self.count = 0
+        self.mean = np.zeros(columns)
+        self.m2 = np.zeros(columns)
+        self.digests = [TDigest(compression) for _ in range(columns)]
+
+    def update(self, batch: np.ndarray):
+        batch = np.asarray(batch, dtype=float).reshape(-1, len(self.mean))
+        if len(batch) == 0:
+            return
+        batch_mean = batch.mean(axis=0)
+        self._combine(len(batch), batch_mean, ((batch - batch_mean) ** 2).sum(axis=0))
+        for digest, column in zip(self.digests, batch.T):
+            digest.update(column)
+
+    def merge(self, other: 'StreamingStats'):
+        if other.count == 0:
+            return
+        self._combine(other.count, other.mean, other.m2)
+        for digest, other_digest in zip(self.digests, other.digests):
+            digest.merge(other_digest)
+
+    def _combine(self, count: int, mean: np.ndarray, m2: np.ndarray):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def variance(self, ddof: int = 1) -> np.ndarray:
+        return self.m2 / (self.count - ddof) if ddof < self.count else np.full(len(self.mean), math.nan)
+
+    def std(self, ddof: int = 1) -> np.ndarray:
+        return np.sqrt(self.variance(ddof))
+
+    def percentile(self, q: float) -> np.ndarray:
+        return np.array([digest.quantile(q / 100) for digest in self.digests])
+
+
+# 重心を k1 スケールでまとめる merging t-digest (バッファ単位でベクトル化して圧縮する)
+class TDigest:
+    def __init__(self, compression: float = 200, buffer_size: int = 10000):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.min, self.max = math.inf, -math.inf
+        self._buffer = []
+        self._buffered = 0
+
+    def update(self, values: Sequence[float]):
+        values = np.asarray(values, dtype=float).ravel()
+        if len(values) == 0:
+            return
+        self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+        self._buffer.append(values)
+        self._buffered += len(values)
+        if self.buffer_size <= self._buffered:
+            self._compress()
+
+    def merge(self, other: 'TDigest'):
+        other.flush()
+        if len(other.means) == 0:
+            return
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self._compress(other.means, other.weights)
+
+    @property
+    def total_weight(self) -> float:
+        self.flush()
+        return self.weights.sum()
+
+    def quantile(self, q: float) -> float:
+        self.flush()
+        if len(self.means) == 0:
+            return math.nan
+        total = self.weights.sum()
+        positions = np.concatenate(((0,), np.cumsum(self.weights) - self.weights / 2, (total,)))
+        values = np.concatenate(((self.min,), self.means, (self.max,)))
+        return float(np.interp(q * total, positions, values))
+
+    def flush(self):
+        self._compress()
+
+    def _compress(self, means: Optional[np.ndarray] = None, weights: Optional[np.ndarray] = None):
+        if not self._buffer and means is None:
+            return
+        means = np.zeros(0) if means is None else means
+        weights = np.zeros(0) if weights is None else weights
+
+        buffered = np.concatenate(self._buffer) if self._buffer else np.zeros(0)
+        means = np.concatenate((self.means, means, buffered))
+        weights = np.concatenate((self.weights, weights, np.ones(len(buffered))))
+        self._buffer, self._buffered = [], 0
+
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+
+        # 累積重みの中点を k1 スケール k(q) = δ / (2π) * asin(2q - 1) に写し、整数部が同じ点を1つの重心にまとめる
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2) / total
+        clusters = np.floor(self.compression / (2 * math.pi) * np.arcsin(2 * q - 1))
+        starts = np.flatnonzero(np.concatenate(((True,), clusters[1:] != clusters[:-1])))
+
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+
+def print_summary(stats: StreamingStats, column: int):
+    percentiles = [stats.percentile(q)[column] for q in SUMMARY_QUANTILES]
+    print(f'mean = {stats.mean[column]}, stddev = {stats.std()[column]}, 2.5%ile = {percentiles[0]}, '
+          f'1Q = {percentiles[1]}, Median = {percentiles[2]}, 3Q = {percentiles[3]}, 97.5%ile = {percentiles[4]}')
+
+
+# 非対話バックエンドでヒストグラムをファイルに書き出す (matplotlib は必要になるまで読み込まない)
+def save_histogram(digest: TDigest, path: str, bins: int = 10):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    digest.flush()
+    fig, ax = plt.subplots()
+    ax.hist(digest.means, bins=bins, range=(digest.min, digest.max), weights=digest.weights)
+    fig.savefig(path)
+    plt.close(fig)
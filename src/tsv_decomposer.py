@@ -0,0 +1,104 @@
+import argparse
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import List, Optional
+
+import numpy as np
+
+from src.overlap_sketch import hash64
+from src.sampling_simulator_util import Cardinality3, CardinalityN, intersection_sizes, membership_of, \
+    print_result_n, region_counts
+from src.userlist_format import is_binary_userlist, open_userlist
+
+# 1バケットあたりのメモリ使用量の目安 (GUID のバイト数に対する倍率込み)
+MEMORY_BUDGET = 512 * 1024 * 1024
+MEMORY_FACTOR = 4
+
+
+# N個の userlist (TSV またはバイナリ形式) の重複を、GUID のハッシュでバケットに分けてディスク上で数える
+def decompose_files(paths: List[str], work_dir: Optional[str] = None, buckets: Optional[int] = None,
+                    max_workers: int = 1, chunk_lines: int = 1 << 20) -> CardinalityN:
+    if buckets is None:
+        total_bytes = sum(os.path.getsize(path) for path in paths)
+        buckets = max(1, math.ceil(total_bytes * MEMORY_FACTOR / MEMORY_BUDGET))
+
+    bucket_dir = tempfile.mkdtemp(prefix='decompose-', dir=work_dir)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # 各ファイルをバケットごとのファイルに振り分ける (ファイルごとに書き出し先が別なので並列に行える)
+            for future in [executor.submit(partition_file, path, k, bucket_dir, buckets, chunk_lines)
+                           for k, path in enumerate(paths)]:
+                future.result()
+
+            counts = sum(executor.map(count_bucket, [(bucket_dir, bucket, len(paths)) for bucket in range(buckets)]))
+    finally:
+        shutil.rmtree(bucket_dir)
+
+    return CardinalityN(intersection_sizes(counts, len(paths)))
+
+
+def decompose_files3(paths: List[str], work_dir: Optional[str] = None, buckets: Optional[int] = None,
+                     max_workers: int = 1) -> Cardinality3:
+    sizes = decompose_files(paths, work_dir, buckets, max_workers).sizes.tolist()
+    return Cardinality3(sizes[0b001], sizes[0b010], sizes[0b100], sizes[0b011], sizes[0b101], sizes[0b110],
+                        sizes[0b111])
+
+
+def partition_file(path: str, k: int, bucket_dir: str, buckets: int, chunk_lines: int = 1 << 20):
+    outputs = [open(f'{bucket_dir}/b{bucket}.list{k}', 'wb') for bucket in range(buckets)]
+    try:
+        for guids in iter_guid_chunks(path, chunk_lines):
+            assigned = (hash64(guids) % np.uint64(buckets)).astype(np.int64)
+            order = np.argsort(assigned, kind='stable')
+            bounds = np.searchsorted(assigned[order], np.arange(buckets + 1))
+            for bucket, output in enumerate(outputs):
+                if bounds[bucket] < bounds[bucket + 1]:
+                    output.write(b'\n'.join(guids[order[bounds[bucket]:bounds[bucket + 1]]].tolist()) + b'\n')
+    finally:
+        for output in outputs:
+            output.close()
+
+
+# TSV は1列目を、バイナリ形式 (userlist_format) は GUID の列を chunk_lines 件ずつ読む
+def iter_guid_chunks(path: str, chunk_lines: int = 1 << 20):
+    if is_binary_userlist(path):
+        guids = open_userlist(path)['guid']
+        for start in range(0, len(guids), chunk_lines):
+            yield np.array(guids[start:start + chunk_lines])
+        return
+
+    with open(path, 'rb') as src:
+        while True:
+            lines = list(islice(src, chunk_lines))
+            if not lines:
+                return
+            yield np.array([line.split(b'\t', 1)[0].rstrip(b'\r\n') for line in lines])
+
+
+def count_bucket(args) -> np.ndarray:
+    bucket_dir, bucket, n_lists = args
+    populations = []
+    for k in range(n_lists):
+        with open(f'{bucket_dir}/b{bucket}.list{k}', 'rb') as src:
+            populations.append(np.unique(np.array(src.read().split(), dtype=bytes)))
+    return region_counts(membership_of(*populations), n_lists)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', type=str, nargs='+',
+                        help='userlist TSV files (GUID in the first column) or binary userlists (.npy)')
+    parser.add_argument('-d', '--work-dir', type=str, help='dir for temporary bucket files (default: system temp)')
+    parser.add_argument('-b', '--buckets', type=int, help='number of hash buckets (default: by file size)')
+    parser.add_argument('-n', '--max-workers', type=int, default=1, help='(default: 1)')
+    args = parser.parse_args()
+
+    print_result_n('actual', decompose_files(args.files, args.work_dir, args.buckets, args.max_workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import argparse
+from itertools import islice
+from os import remove
+from typing import List
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from src.line_sampler import iter_line_blocks, map_file, select_exact
+from src.random_streams import Seed, generator
+
+GUID_LENGTH = 26
+
+# str(round(score, 3)) と同じ表記
+SCORE_SCALE = 1000
+SCORE_LABELS = [str(level / SCORE_SCALE).encode() for level in range(SCORE_SCALE + 1)]
+SCORE_LABEL_SIZES = np.array([len(label) for label in SCORE_LABELS])
+
+# バイナリ形式の userlist: GUID (26バイト固定) とスコア (1/1000 単位の uint16) のレコードを並べた .npy ファイル
+# TSV と同じくスコアの降順 (同点は元の順) に並べておく
+USERLIST_DTYPE = np.dtype([('guid', f'S{GUID_LENGTH}'), ('score', '<u2')])
+
+CHUNK_RECORDS = 1 << 20
+
+
+# スコアは小数第3位までなので 1/1000 単位の整数で扱う
+def score_levels(scores: np.ndarray) -> np.ndarray:
+    return np.rint(np.asarray(scores) * SCORE_SCALE).astype(np.int16)
+
+
+def is_binary_userlist(path: str) -> bool:
+    return path.endswith('.npy')
+
+
+def open_userlist(path: str) -> np.ndarray:
+    return np.load(path, mmap_mode='r')
+
+
+def save_userlist(path: str, guids: np.ndarray, scores: np.ndarray):
+    records = np.empty(len(guids), dtype=USERLIST_DTYPE)
+    records['guid'] = guids
+    records['score'] = scores
+    np.save(path, records)
+
+
+def write_tsv(dest, guids: np.ndarray, scores: np.ndarray):
+    for start in range(0, len(guids), CHUNK_RECORDS):
+        stop = start + CHUNK_RECORDS
+        dest.write(b''.join(guid + b'\t' + SCORE_LABELS[score] + b'\n'
+                            for guid, score in zip(guids[start:stop].tolist(), scores[start:stop].tolist())))
+
+
+# 0件のファイルはメモリマップできないので通常の配列を返す
+def create_userlist(path: str, count: int) -> np.ndarray:
+    if count == 0:
+        records = np.zeros(0, dtype=USERLIST_DTYPE)
+        np.save(path, records)
+        return records
+    return open_memmap(path, mode='w+', dtype=USERLIST_DTYPE, shape=(count,))
+
+
+def close_userlist(records: np.ndarray):
+    if isinstance(records, np.memmap):
+        records.flush()
+
+
+def userlist_to_tsv(src_file: str, dest_file: str) -> int:
+    records = open_userlist(src_file)
+    with open(dest_file, 'wb') as dest:
+        write_tsv(dest, records['guid'], records['score'])
+    return len(records)
+
+
+def tsv_to_userlist(src_file: str, dest_file: str) -> int:
+    total_count = sum(len(ends) for _, ends in iter_line_blocks(map_file(src_file)))
+
+    records = create_userlist(dest_file, total_count)
+    try:
+        with open(src_file, 'rb') as src:
+            for start in range(0, total_count, CHUNK_RECORDS):
+                columns = [line.rstrip(b'\r\n').split(b'\t', 1) for line in islice(src, CHUNK_RECORDS)]
+                stop = start + len(columns)
+                guids = [guid for guid, _ in columns]
+                # S26 に入らない GUID は切り詰められて別のユーザーと同じになってしまうので受け付けない
+                longest = max(map(len, guids))
+                if GUID_LENGTH < longest:
+                    raise ValueError(f'{src_file} has a GUID of {longest} bytes, longer than {GUID_LENGTH}')
+                records['guid'][start:stop] = guids
+                records['score'][start:stop] = score_levels(np.array([score for _, score in columns], dtype=float))
+    except BaseException:
+        records = None
+        remove(dest_file)
+        raise
+    close_userlist(records)
+    return total_count
+
+
+# スコアの降順に並んだ userlist を併合する (同点は先に渡したファイルのレコードを先に並べる)
+# 各ファイルでスコアごとのレコードは連続しているので、比較せずに書き出し先の位置を計算してコピーする
+def merge_userlists(input_files: List[str], dest_file: str) -> int:
+    sources = [open_userlist(file) for file in input_files]
+    counts = np.array([np.bincount(SCORE_SCALE - source['score'].astype(np.int64), minlength=SCORE_SCALE + 1)
+                       for source in sources])
+
+    src_offsets = np.cumsum(counts, axis=1) - counts
+    dest_offsets = (np.cumsum(counts.T) - counts.T.ravel()).reshape(counts.T.shape).T
+
+    dest = create_userlist(dest_file, int(counts.sum()))
+    for t, source in enumerate(sources):
+        for bucket in np.flatnonzero(counts[t]):
+            start, size = src_offsets[t, bucket], counts[t, bucket]
+            dest[dest_offsets[t, bucket]:dest_offsets[t, bucket] + size] = source[start:start + size]
+    close_userlist(dest)
+    return len(dest)
+
+
+# line_sampler.sample_lines と同じ抽出をレコード単位で行う
+def sample_userlist(src_file: str, dest_file: str, sampling_rate: float, bernoulli: bool = False,
+                    seed: Seed = None) -> int:
+    rng = generator(seed)
+    records = open_userlist(src_file)
+    remaining, sample = len(records), round(sampling_rate * len(records))
+
+    selected = [np.zeros(0, dtype=np.int64)]
+    for start in range(0, len(records), CHUNK_RECORDS):
+        size = min(CHUNK_RECORDS, len(records) - start)
+        if bernoulli:
+            selected.append(start + np.flatnonzero(rng.random(size) < sampling_rate))
+        else:
+            selected.append(start + select_exact(rng, size, remaining, sample))
+            remaining -= size
+            sample -= len(selected[-1])
+    selected = np.concatenate(selected)
+
+    dest = create_userlist(dest_file, len(selected))
+    for start in range(0, len(selected), CHUNK_RECORDS):
+        dest[start:start + CHUNK_RECORDS] = records[selected[start:start + CHUNK_RECORDS]]
+    close_userlist(dest)
+    return len(selected)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('src', type=str, help='userlist file (.tsv or binary .npy)')
+    parser.add_argument('dest', type=str, help='converted file (.npy for a TSV source, otherwise .tsv)')
+    args = parser.parse_args()
+
+    convert = userlist_to_tsv if is_binary_userlist(args.src) else tsv_to_userlist
+    print(f'records: {convert(args.src, args.dest)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,29 +1,47 @@
 #!/usr/bin/env python3
 
 import argparse
+import heapq
+import math
 import multiprocessing
 import shutil
-import string
-import sys
-from concurrent.futures import ProcessPoolExecutor
-from functools import reduce
-from itertools import combinations, chain, islice, count
-from operator import itemgetter, lt, gt
-from os import makedirs
-from random import choices, sample
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from operator import itemgetter
+from os import makedirs, remove
+from os.path import getsize
+from typing import Optional
 
 import numpy as np
 
+from src.guid_generator import GUID_MODES, generate_guids
+from src.line_sampler import sample_lines
+from src.random_streams import Seed, generator, spawn_seeds
+from src.sampling_args import add_probability_arguments, probabilities_from_args
+from src.sampling_simulator_util import generate_membership
+from src.userlist_format import SCORE_LABEL_SIZES, SCORE_SCALE, merge_userlists, sample_userlist, \
+    save_userlist, score_levels, write_tsv
+
+WRITE_CHUNK_LINES = 1 << 16
+READ_BUFFER_SIZE = 1 << 20
+WRITE_BUFFER_SIZE = 1 << 22
+
+# マージを分割する際に境界のキーを選ぶための標本数
+PARTITION_SAMPLES = 1024
+
+# save_guid_sets がユーザー1人あたりに使う作業メモリの見積もり (GUID、所属、スコア、並べ替えの添字と一時配列)
+BYTES_PER_USER = 256
+
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('p1', type=float)
-    parser.add_argument('p2', type=float)
-    parser.add_argument('p3', type=float)
-    parser.add_argument('p12', type=float)
-    parser.add_argument('p13', type=float)
-    parser.add_argument('p23', type=float)
-    parser.add_argument('p123', type=float, nargs='?')
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+def add_arguments(parser):
+    add_probability_arguments(parser, 3)
     parser.add_argument('-u', '--users', type=int, default=3000000, help='size of unique users (default: 3000000)')
     parser.add_argument('-r', '--sampling-rate', type=float, default=0.1, help='sampling rate (default: 0.1)')
     parser.add_argument('-d', '--output-dir', type=str, default='output',
@@ -31,141 +49,388 @@ def main():
     parser.add_argument('-s', '--splits', type=int, default=multiprocessing.cpu_count(), help='(default: cpu count)')
     parser.add_argument('-n', '--max-workers', type=int, default=multiprocessing.cpu_count(),
                         help='(default: cpu count)')
-    args = parser.parse_args()
-
-    if args.p123 is None:
-        p1, p2, p3, p12, p13, p23 = args.p1, args.p2, args.p3, args.p12, args.p13, args.p23
-        p123 = round(1 - sum((p1, p2, p3, p12, p13, p23)), 9)
-        if p12 < 0:
-            print('the sum of params exceeds 1', file=sys.stderr)
-            exit(-1)
-    else:
-        orig = np.array((args.p1, args.p2, args.p3, args.p12, args.p13, args.p23, args.p123))
-        p1, p2, p3, p12, p13, p23, p123 = orig / orig.sum()
+    parser.add_argument('-m', '--merge-partitions', type=int, default=1,
+                        help='merge each list in this many score ranges in parallel (default: 1)')
+    parser.add_argument('--bernoulli', action='store_true',
+                        help='sample each line independently with the rate instead of an exact count')
+    parser.add_argument('--bucketed', action='store_true',
+                        help='write per-score buckets and build each list by concatenating them instead of merging')
+    parser.add_argument('--binary', action='store_true',
+                        help='write binary userlists (list{k}.npy / sample{k}.npy, see userlist_format) instead of TSV')
+    parser.add_argument('--guid-mode', type=str, choices=GUID_MODES, default='counter',
+                        help='counter: unique across splits, dedup: unique within a split, random (default: counter)')
+    parser.add_argument('--memory-budget', type=int,
+                        help='memory (MB) per split worker; users beyond it are spilled in sorted runs (default: none)')
+    parser.add_argument('--seed', type=int, help='seed for reproducible runs')
+
+
+def run(args):
+    p1, p2, p3, p12, p13, p23, p123 = probabilities_from_args(args, 3)
 
     print(f'p1={p1}, p2={p2}, p3={p3}, p12={p12}, p13={p13}, p23={p23}, p123={p123}')
     print(f'users={args.users}, sampling rate={args.sampling_rate}, output dir={args.output_dir}')
-    print(f'splits={args.splits}, max workers={args.max_workers}')
+    print(f'splits={args.splits}, max workers={args.max_workers}, memory budget={args.memory_budget} MB')
 
     probs = (p1, p2, p3, p12, p13, p23, p123)
-    generate_userlists(probs, args.users, args.sampling_rate, args.output_dir, args.splits, args.max_workers)
+    metrics = generate_userlists(probs, args.users, args.sampling_rate, args.output_dir, args.splits,
+                                 args.max_workers, args.seed, args.merge_partitions, args.bucketed, args.bernoulli,
+                                 args.binary, args.guid_mode,
+                                 None if args.memory_budget is None else args.memory_budget << 20)
+    print(format_phase_metrics(metrics))
 
 
-def generate_userlists(probs, unique_users, sampling_rate, base_dir, splits, max_workers):
+def generate_userlists(probs, unique_users, sampling_rate, base_dir, splits, max_workers, seed: Seed = None,
+                       merge_partitions: int = 1, bucketed: bool = False, bernoulli: bool = False,
+                       binary: bool = False, guid_mode: str = 'counter', memory_budget: Optional[int] = None):
     makedirs(base_dir, exist_ok=True)
 
+    # 分割ごと・リストごとに独立な乱数列を使う (fork したワーカーが同じ乱数状態を引き継がないように)
+    split_seed, sample_seed, guid_seed = spawn_seeds(seed, 3)
+    split_seeds, sample_seeds = spawn_seeds(split_seed, splits), spawn_seeds(sample_seed, 3)
+
+    # counter モードの GUID は全分割で共通の鍵と、分割ごとに異なる名前空間 (分割番号) から作る
+    guid_key = int(generator(guid_seed).integers(2 ** 63))
+
+    # 分割ごとのユーザーを memory_budget に収まるチャンクに分け、整列済みのランとして書き出す
+    chunk_users = budget_chunk_users(memory_budget)
+    runs = spill_runs(unique_users // splits, chunk_users)
+    ext = 'npy' if binary else 'tsv'
+
+    # 1つのプールで、入力が揃ったタスクから順に投入する
+    # 生成 (分割ごと) -> リスト k のマージ (全分割の生成後) -> リスト k の抽出 (リスト k のマージ後)
+    # ワーカーの例外はその場で送出し、調査できるように作業ディレクトリは残す
+    # フェーズ名: [タスク数, 開始時刻, 終了時刻, タスクの実行時間の合計, 行数, 書き出したバイト数]
+    # 時刻はワーカーがタスクを実行し始めた・終えた時点 (キューで待った時間は含めない)
+    metrics = {}
     with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        for task_id in range(splits):
-            executor.submit(save_guid_sets, probs, unique_users // splits, task_id, base_dir)
+        pending = {}
 
-    with ProcessPoolExecutor(max_workers=3) as executor:
-        for i in range(1, 4):
-            executor.submit(merge_and_sample, i, sampling_rate, base_dir, splits)
+        def submit(phase, k, outputs, func, *args):
+            pending[executor.submit(timed_task, func, *args)] = (phase, k, outputs)
+            metrics.setdefault(phase_name(phase, k), [0, math.inf, -math.inf, 0.0, 0, 0])
+
+        for task_id in range(splits):
+            submit('generate', None, work_files(base_dir, range(1, 4), [task_id], runs, ext), save_guid_sets, probs,
+                   unique_users // splits, task_id, base_dir, split_seeds[task_id], bucketed, binary, guid_mode,
+                   guid_key, chunk_users)
+
+        generating = splits
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                phase, k, outputs = pending.pop(future)
+                try:
+                    started, finished, rows = future.result()
+                except BaseException as error:
+                    for other in pending:
+                        other.cancel()
+                    raise RuntimeError(f'{phase_name(phase, k)} failed; work files are kept in {base_dir}/work') \
+                        from error
+
+                record = metrics[phase_name(phase, k)]
+                record[0] += 1
+                record[1], record[2] = min(record[1], started), max(record[2], finished)
+                record[3] += finished - started
+                record[4] += rows
+                record[5] += sum(getsize(output) for output in outputs)
+
+                if phase == 'generate':
+                    generating -= 1
+                    if generating == 0:
+                        for k in range(1, 4):
+                            submit('merge', k, [f'{base_dir}/list{k}.{ext}'], merge_list, k, base_dir, splits,
+                                   merge_partitions, bucketed, binary, runs)
+                elif phase == 'merge':
+                    submit('sample', k, [f'{base_dir}/sample{k}.{ext}'], sample_list, k, sampling_rate, base_dir,
+                           rows, sample_seeds[k - 1], bernoulli, binary)
 
     shutil.rmtree(f'{base_dir}/work')
+    return metrics
+
+
+# perf_counter はプロセスをまたいで同じ時計 (Linux では CLOCK_MONOTONIC) なので、親の側で比べられる
+def timed_task(func, *args):
+    started = time.perf_counter()
+    rows = func(*args)
+    return started, time.perf_counter(), rows
 
 
-def save_guid_sets(probs, unique_users, task_id, base_dir):
+def phase_name(phase, k=None) -> str:
+    return phase if k is None else f'{phase} list{k}'
+
+
+def format_phase_metrics(metrics) -> str:
+    lines = [f'{"phase":<14} {"tasks":>6} {"start s":>9} {"wall s":>9} {"busy s":>9} {"rows":>12} {"rows/s":>12} '
+             f'{"MB written":>11}']
+    origin = min((record[1] for record in metrics.values()), default=0.0)
+    for phase, (tasks, started, finished, busy, rows, written) in metrics.items():
+        wall = finished - started
+        lines.append(f'{phase:<14} {tasks:>6} {started - origin:>9.3f} {wall:>9.3f} {busy:>9.3f} {rows:>12} '
+                     f'{rows / wall if 0 < wall else 0:>12.0f} {written / (1 << 20):>11.1f}')
+    return '\n'.join(lines)
+
+
+# chunk_users 人ずつ生成し、チャンクごとに整列したラン (work/t{task_id}/list{i}.{run}.tsv) を書き出す
+# dedup モードの重複の引き直しはチャンクの中でしか行わない (counter モードは通し番号なのでチャンクをまたいでも重複しない)
+def save_guid_sets(probs, unique_users, task_id, base_dir, seed: Seed = None, bucketed: bool = False,
+                   binary: bool = False, guid_mode: str = 'random', guid_key: int = 0,
+                   chunk_users: Optional[int] = None):
     work_dir = f'{base_dir}/work/t{task_id}'
     makedirs(work_dir, exist_ok=True)
 
-    destinations = tuple(islice(powerset(range(3)), 1, None))
-    buf = [{} for _ in range(3)]
-    for guid in guid_seq(unique_users):
-        for indices in choices(destinations, probs):
-            for index in indices:
-                buf[index][guid] = round(np.random.beta(1, 3), 3)
+    rng = generator(seed)
+    chunk_users = chunk_users or max(unique_users, 1)
+    for run in range(spill_runs(unique_users, chunk_users)):
+        start = run * chunk_users
+        size = min(chunk_users, unique_users - start)
+        memberships = generate_membership(probs, size, seed=rng)
+        guids = generate_guids(size, rng, guid_mode, guid_key, namespace=task_id, start=start)
 
-    userlists = [sorted(userlist.items(), key=itemgetter(1), reverse=True) for userlist in buf]
+        for i in range(1, 4):
+            # リストに含まれるユーザーをスコアの降順 (同点は生成順) に並べる
+            # スコアは 1001 段階しかないので、バケット番号 (0 が最高点) の安定ソートは基数ソートになる
+            members = guids[memberships & (1 << (i - 1)) != 0]
+            scores = score_levels(rng.beta(1, 3, len(members)))
+            order = np.argsort(SCORE_SCALE - scores, kind='stable')
+            if binary:
+                save_userlist(f'{work_dir}/list{i}.{run}.npy', members[order], scores[order])
+            else:
+                write_userlist(f'{work_dir}/list{i}.{run}.tsv', members[order], scores[order], bucketed)
+            del members, scores, order
+        del memberships, guids
 
-    for i, userlist in enumerate(userlists, start=1):
-        with open(f'{work_dir}/list{i}.tsv', 'w') as dest:
-            for guid, score in userlist:
-                print('\t'.join((guid, str(score))), file=dest)
+    return unique_users
 
 
-def merge_and_sample(k, sampling_rate, base_dir, splits):
-    line_count = merge_work_files(k, splits, base_dir)
-    sample_from_file(f'{base_dir}/list{k}.tsv', f'{base_dir}/sample{k}.tsv', sampling_rate, line_count)
+def budget_chunk_users(memory_budget: Optional[int]) -> Optional[int]:
+    return None if memory_budget is None else max(memory_budget // BYTES_PER_USER, 1)
 
 
-def merge_work_files(k, splits, base_dir) -> int:
-    work_dir = f'{base_dir}/work'
-    input_files = [f'{work_dir}/t{task_id}/list{k}.tsv'for task_id in range(splits)]
-    dest_file = f'{base_dir}/list{k}.tsv'
+def spill_runs(unique_users: int, chunk_users: Optional[int]) -> int:
+    return max(-(-unique_users // chunk_users), 1) if chunk_users else 1
 
-    return merge_file(input_files, dest_file, lambda line: float(line.split('\t')[1]), reverse=True)
 
+# リスト lists の、分割 task_ids のランを (分割, ラン) の順に並べる
+# 同点の行は先に渡した入力の行が先に出るので、分割ごとに全ユーザーを一度に整列した場合と同じ並びになる
+def work_files(base_dir, lists, task_ids, runs: int = 1, ext: str = 'tsv'):
+    return [f'{base_dir}/work/t{task_id}/list{k}.{run}.{ext}'
+            for k in lists for task_id in task_ids for run in range(runs)]
 
-def sample_from_file(src_file, dest_file, sampling_rate, total_count):
-    sample_count = round(sampling_rate * total_count)
-    sample_indices = set(sample(range(sample_count), sample_count))
-    with open(src_file) as src, open(dest_file, 'w') as dest:
-        for i, line in enumerate(src):
-            if i in sample_indices:
-                dest.write(line)
 
+def write_userlist(path, guids: np.ndarray, scores: np.ndarray, bucketed: bool = False):
+    with open(path, 'wb') as dest:
+        write_tsv(dest, guids, scores)
 
-def merge_file(input_files, dest_file, key, reverse=False) -> int:
-    sources = [open(file) for file in input_files]
+    if bucketed:
+        # スコアの降順に並んだバケットごとの行数とバイト数
+        buckets = SCORE_SCALE - scores
+        line_sizes = np.char.str_len(guids) + SCORE_LABEL_SIZES[scores] + 2
+        np.savez(f'{path}.buckets.npz', counts=np.bincount(buckets, minlength=SCORE_SCALE + 1),
+                 sizes=np.bincount(buckets, weights=line_sizes, minlength=SCORE_SCALE + 1).astype(np.int64))
 
-    def read_next(src):
-        try:
-            line = next(src).rstrip('\r\n')
-            return line, key(line)
-        except StopIteration:
-            return None
 
-    selection_func = max_with_index if reverse else min_with_index
-    buf = [read_next(src) for src in sources]
+def merge_list(k, base_dir, splits, merge_partitions: int = 1, bucketed: bool = False, binary: bool = False,
+               runs: int = 1) -> int:
+    if binary:
+        return merge_userlists(work_files(base_dir, [k], range(splits), runs, 'npy'), f'{base_dir}/list{k}.npy')
+    return merge_work_files(k, splits, base_dir, merge_partitions, bucketed, runs)
 
-    total_count = 0
-    with open(dest_file, 'w') as out:
-        while any(buf):
-            index, value = selection_func(buf, itemgetter(1))
-            print(value[0], file=out)
-            total_count += 1
-            buf[index] = read_next(sources[index])
 
-    for source in sources:
-        source.close()
+def sample_list(k, sampling_rate, base_dir, line_count, seed: Seed = None, bernoulli: bool = False,
+                binary: bool = False) -> int:
+    if binary:
+        return sample_userlist(f'{base_dir}/list{k}.npy', f'{base_dir}/sample{k}.npy', sampling_rate, bernoulli, seed)
+    return sample_from_file(f'{base_dir}/list{k}.tsv', f'{base_dir}/sample{k}.tsv', sampling_rate, line_count, seed,
+                            bernoulli)
 
-    return total_count
 
+def merge_work_files(k, splits, base_dir, partitions: int = 1, bucketed: bool = False, runs: int = 1) -> int:
+    input_files = work_files(base_dir, [k], range(splits), runs)
+    dest_file = f'{base_dir}/list{k}.tsv'
+
+    if bucketed:
+        return concat_buckets(input_files, dest_file, partitions, max_workers=partitions)
+    return merge_file(input_files, dest_file, score_key, reverse=True, partitions=partitions, max_workers=partitions)
 
-def max_with_index(seq, key=lambda x: x):
-    return reduce(build_reducer(gt, key), enumerate(seq), (None,))[0]
 
+def score_key(line: str) -> float:
+    return float(line.split('\t')[1])
 
-def min_with_index(seq, key=lambda x: x):
-    return reduce(build_reducer(lt, key), enumerate(seq), (None,))[0]
 
+# 各ラン (分割ごと、チャンクごと) のファイルはスコアの降順にバケットが並んでいるので、バケットごとに入力の順に連結すれば
+# マージした場合と同じ並び (同点は分割番号、ラン番号の小さい方から) になる
+# 書き出し先の位置はバケットのバイト数から決まるので、バケットの範囲ごとに並列に書き込める
+def concat_buckets(input_files, dest_file, partitions: int = 1, max_workers: int = 1) -> int:
+    buckets = [np.load(f'{file}.buckets.npz') for file in input_files]
+    counts = sum(bucket['counts'] for bucket in buckets)
+    sizes = np.array([bucket['sizes'] for bucket in buckets])
 
-def build_reducer(comparator, key):
-    def reducer(acc, elem):
-        if acc[0] is None:
-            return elem, None if elem[1] is None else key(elem[1])
+    # (分割, バケット) ごとの読み出し位置と、(バケット, 分割) の順に並べた書き出し位置
+    src_offsets = np.cumsum(sizes, axis=1) - sizes
+    dest_offsets = (np.cumsum(sizes.T) - sizes.T.ravel()).reshape(sizes.T.shape).T
 
-        if elem[1] is not None:
-            value = key(elem[1])
-            if acc[1] is None or comparator(value, acc[1]):
-                return elem, value
+    with open(dest_file, 'wb') as dest:
+        dest.truncate(int(sizes.sum()))
 
-        return acc
+    # バイト数がおおよそ均等になるようにバケットの範囲を分ける
+    bucket_ends = np.cumsum(sizes.sum(axis=0))
+    bounds = np.unique(np.searchsorted(bucket_ends, np.arange(1, partitions) * bucket_ends[-1] / partitions))
+    tasks = [(dest_file, [(file, int(src_offsets[t, b]), int(sizes[t, b]), int(dest_offsets[t, b]))
+                          for b in range(start, stop) for t, file in enumerate(input_files) if sizes[t, b]])
+             for start, stop in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [sizes.shape[1]])))]
 
-    return reducer
+    if max_workers <= 1:
+        for task in tasks:
+            copy_ranges(task)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(copy_ranges, tasks))
+
+    return int(counts.sum())
+
+
+def copy_ranges(args):
+    dest_file, ranges = args
+    sources = {}
+    try:
+        with open(dest_file, 'r+b') as dest:
+            for file, src_offset, size, dest_offset in ranges:
+                if file not in sources:
+                    sources[file] = open(file, 'rb')
+                src = sources[file]
+                src.seek(src_offset)
+                dest.seek(dest_offset)
+                while 0 < size:
+                    block = src.read(min(size, WRITE_BUFFER_SIZE))
+                    dest.write(block)
+                    size -= len(block)
+    finally:
+        for src in sources.values():
+            src.close()
+
+
+def sample_from_file(src_file, dest_file, sampling_rate, total_count, seed: Seed = None, bernoulli: bool = False):
+    return sample_lines(src_file, dest_file, sampling_rate, total_count, bernoulli, seed)
+
+
+def merge_file(input_files, dest_file, key, reverse=False, partitions: int = 1, max_workers: int = 1) -> int:
+    if partitions <= 1:
+        sources = [open(file, 'rb', buffering=READ_BUFFER_SIZE) for file in input_files]
+        try:
+            with open(dest_file, 'wb', buffering=WRITE_BUFFER_SIZE) as out:
+                return merge_lines(sources, out, key, reverse)
+        finally:
+            for source in sources:
+                source.close()
+
+    # キーの範囲で分割し、範囲ごとのマージを並列に行ってから順に連結する (同じキーの行は同じ範囲に入る)
+    boundaries = partition_boundaries(input_files, key, reverse, partitions)
+    offsets = [range_offsets(file, key, reverse, boundaries) for file in input_files]
+    part_files = [f'{dest_file}.part{i}' for i in range(len(offsets[0]) - 1)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        total_count = sum(executor.map(merge_range, [
+            (input_files, [(file_offsets[i], file_offsets[i + 1]) for file_offsets in offsets], part_file, key, reverse)
+            for i, part_file in enumerate(part_files)]))
 
+    with open(dest_file, 'wb') as out:
+        for part_file in part_files:
+            with open(part_file, 'rb') as src:
+                shutil.copyfileobj(src, out, WRITE_BUFFER_SIZE)
+            remove(part_file)
 
-def guid_seq(times=None):
-    return (generate_guid() for _ in islice(count(), times))
+    return total_count
 
 
-def generate_guid():
-    return ''.join(choices(string.ascii_uppercase + string.digits, k=26))
+# 整列済みの行の列を heapq.merge で併合する (キーが等しい行は先に渡した入力の行を先に出す)
+def merge_lines(sources, out, key, reverse=False) -> int:
+    def decoded(source):
+        for line in source:
+            line = line.decode().rstrip('\r\n')
+            yield line, key(line)
 
+    merged = heapq.merge(*(decoded(source) for source in sources), key=itemgetter(1), reverse=reverse)
 
-def powerset(elements):
-    return chain.from_iterable(combinations(elements, r) for r in range(len(elements)+1))
+    total_count = 0
+    while True:
+        lines = [line for line, _ in islice(merged, WRITE_CHUNK_LINES)]
+        if not lines:
+            return total_count
+        out.write(('\n'.join(lines) + '\n').encode())
+        total_count += len(lines)
+
+
+def merge_range(args) -> int:
+    input_files, ranges, dest_file, key, reverse = args
+    sources = [read_range(file, start, stop) for file, (start, stop) in zip(input_files, ranges)]
+    with open(dest_file, 'wb', buffering=WRITE_BUFFER_SIZE) as out:
+        return merge_lines(sources, out, key, reverse)
+
+
+def read_range(path, start, stop):
+    with open(path, 'rb', buffering=READ_BUFFER_SIZE) as src:
+        src.seek(start)
+        remaining = stop - start
+        for line in src:
+            if remaining <= 0:
+                return
+            remaining -= len(line)
+            yield line
+
+
+# 範囲の境界となるキー (全入力の等間隔の位置にある行のキーから選ぶ)
+def partition_boundaries(input_files, key, reverse, partitions: int):
+    keys = set()
+    for file in input_files:
+        size = getsize(file)
+        with open(file, 'rb') as src:
+            keys.update(key(line) for line in (line_at(src, size * i // PARTITION_SAMPLES)
+                                               for i in range(PARTITION_SAMPLES)) if line)
+    keys = sorted(keys, reverse=reverse)
+    return [keys[len(keys) * i // partitions] for i in range(1, partitions)] if keys else []
+
+
+# 各範囲の先頭の行のバイト位置 (先頭は 0、末尾はファイルサイズ)
+def range_offsets(path, key, reverse, boundaries):
+    size = getsize(path)
+    with open(path, 'rb') as src:
+        return [0] + [first_line_not_before(src, size, key, boundary, reverse) for boundary in boundaries] + [size]
+
+
+def line_at(src, offset) -> str:
+    src.seek(max(offset - 1, 0))
+    if 0 < offset:
+        src.readline()
+    return src.readline().decode().rstrip('\r\n')
+
+
+# キーが boundary より前に並ぶ行を飛ばした、最初の行の位置を二分探索で求める
+def first_line_not_before(src, size, key, boundary, reverse) -> int:
+    def before(line: bytes) -> bool:
+        value = key(line.decode().rstrip('\r\n'))
+        return boundary < value if reverse else value < boundary
+
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        src.seek(max(mid - 1, 0))
+        if 0 < mid:
+            src.readline()
+        start = src.tell()
+        if hi <= start:
+            # [mid, hi) に行頭がなければ lo から順に読む
+            src.seek(lo)
+            while lo < hi:
+                line = src.readline()
+                if not before(line):
+                    return lo
+                lo += len(line)
+            return hi
+        line = src.readline()
+        if before(line):
+            lo = start + len(line)
+        else:
+            hi = start
+    return lo
 
 
 if __name__ == '__main__':
@@ -0,0 +1,201 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from os.path import dirname, exists, join
+from typing import Dict, List, Optional
+
+from src.sampling_simulator_util import REGION_MASKS2, REGION_MASKS3, decompose2, decompose3, generate_membership, \
+    membership_to_sets
+
+SIZES = (10 ** 5, 10 ** 6, 10 ** 7)
+WAYS = (2, 3)
+SAMPLING_RATE = 0.1
+EPOCHS = 20
+
+# 前回の結果より何割以上遅くなったら劣化とみなすか
+TOLERANCE = 0.2
+
+# 比較に使う既定の結果 (python -m test.bench_sampling -o test/bench_sampling_baseline.json で更新する)
+BASELINE = join(dirname(__file__), 'bench_sampling_baseline.json')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('cases', type=str, nargs='*', help=f'cases to run (default: all of {", ".join(CASES)})')
+    parser.add_argument('-u', '--users', type=int, nargs='+', default=SIZES,
+                        help=f'population sizes (default: {" ".join(map(str, SIZES))})')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per case, the best is kept (default: 3)')
+    parser.add_argument('-o', '--output', type=str, help='JSON file to save the results to')
+    parser.add_argument('-b', '--baseline', type=str, default=BASELINE,
+                        help='JSON file of earlier results to compare with (default: bench_sampling_baseline.json)')
+    parser.add_argument('-t', '--tolerance', type=float, default=TOLERANCE,
+                        help=f'slowdown ratio reported as a regression (default: {TOLERANCE})')
+    parser.add_argument('--seed', type=int, default=0, help='(default: 0)')
+    args = parser.parse_args()
+
+    unknown = [name for name in args.cases if name not in CASES]
+    if unknown:
+        parser.error(f'unknown cases: {", ".join(unknown)}')
+
+    results = run_benchmarks(args.cases or list(CASES), args.users, args.repeat, args.seed)
+    baseline = load_results(args.baseline)['cases'] if args.baseline and exists(args.baseline) else []
+    regressions = print_results(results, baseline, args.tolerance)
+
+    if args.output:
+        save_results(results, args.output)
+
+    if regressions:
+        exit(1)
+
+
+def run_benchmarks(names: List[str], sizes, repeat: int = 3, seed: int = 0) -> List[Dict]:
+    # ピーク RSS をケースごとに測るため、1ケースごとに新しいプロセスを起動する
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for name in names:
+        for ways in CASES[name][0]:
+            for users in sizes:
+                with context.Pool(1) as pool:
+                    results.append(pool.apply(run_case, (name, ways, users, repeat, seed)))
+    return results
+
+
+def run_case(name: str, ways: int, users: int, repeat: int = 3, seed: int = 0) -> Dict:
+    _, setup, func, unit = CASES[name]
+    args = setup(ways, users, seed)
+
+    timings = []
+    for i in range(repeat):
+        random.seed(seed + i)
+        started, cpu_started = time.perf_counter(), time.process_time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func(ways, users, args)
+        timings.append((time.perf_counter() - started, time.process_time() - cpu_started))
+
+    seconds, cpu_seconds = min(timings)
+    work = EPOCHS if unit == 'epochs/s' else users
+    return {
+        'case': name,
+        'ways': ways,
+        'users': users,
+        'seconds': seconds,
+        'cpu_seconds': cpu_seconds,
+        # Linux では KiB 単位
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'throughput': work / seconds,
+        'unit': unit,
+    }
+
+
+def print_results(results: List[Dict], baseline: List[Dict], tolerance: float = TOLERANCE) -> int:
+    previous = {(r['case'], r['ways'], r['users']): r for r in baseline}
+
+    regressions = 0
+    print(f'{"case":<30} {"ways":>4} {"users":>10} {"seconds":>10} {"rss MB":>9} {"throughput":>14}  baseline')
+    for result in results:
+        line = f'{result["case"]:<30} {result["ways"]:>4} {result["users"]:>10} {result["seconds"]:>10.4f} ' \
+               f'{result["peak_rss_mb"]:>9.1f} {result["throughput"]:>10.4g} {result["unit"]:<9}'
+
+        base = previous.get((result['case'], result['ways'], result['users']))
+        if base is not None:
+            ratio = result['seconds'] / base['seconds']
+            regressed = 1 + tolerance < ratio
+            regressions += regressed
+            line += f'{ratio:.2f}x' + (' REGRESSION' if regressed else '')
+        print(line)
+
+    return regressions
+
+
+def save_results(results: List[Dict], path: str):
+    with open(path, 'w') as dest:
+        json.dump({
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'cases': results,
+        }, dest, indent=2)
+
+
+def load_results(path: Optional[str]) -> Dict:
+    with open(path) as src:
+        return json.load(src)
+
+
+def probs_of(ways: int):
+    return (1 / 3,) * 3 if ways == 2 else (1 / 7,) * 7
+
+
+def testsets(ways: int, users: int, seed: int = 0):
+    masks = REGION_MASKS2 if ways == 2 else REGION_MASKS3
+    return membership_to_sets(generate_membership(probs_of(ways), users, masks, seed), ways)
+
+
+def no_setup(ways: int, users: int, seed: int = 0):
+    return seed
+
+
+def membership_of_size(ways: int, users: int, seed: int = 0):
+    return generate_membership(probs_of(ways), users, seed=seed)
+
+
+def bench_generate_testsets(ways: int, users: int, seed: int):
+    if ways == 3:
+        from src.sampling_driver import generate_testsets
+        generate_testsets(*probs_of(ways), users, seed)
+    else:
+        testsets(ways, users, seed)
+
+
+def bench_decompose(ways: int, users: int, sets):
+    (decompose2 if ways == 2 else decompose3)(*sets)
+
+
+def bench_do_sampling(ways: int, users: int, sets):
+    if ways == 2:
+        from src.sampling_simulator_2 import do_sampling
+    else:
+        from src.sampling_simulator import do_sampling
+    do_sampling(*sets, *(SAMPLING_RATE,) * ways)
+
+
+def bench_pickup_cross_region_elements(ways: int, users: int, sets):
+    from src.separate_sampling_simulator import pickup_cross_region_elements
+    pickup_cross_region_elements(*sets, SAMPLING_RATE)
+
+
+def bench_simulate(ways: int, users: int, sets):
+    if ways == 2:
+        from src.sampling_simulator_2 import simulate
+    else:
+        from src.sampling_simulator import simulate
+    simulate(*sets, SAMPLING_RATE)
+
+
+def bench_simulate_epochs(ways: int, users: int, membership):
+    from src.separate_sampling_simulator import simulate
+    simulate(membership, EPOCHS, SAMPLING_RATE, seed=0)
+
+
+# ケース名: (対象のリスト数, 準備, 計測する処理, スループットの単位)
+CASES = {
+    'generate_testsets': (WAYS, no_setup, bench_generate_testsets, 'users/s'),
+    'decompose': (WAYS, testsets, bench_decompose, 'users/s'),
+    'do_sampling': (WAYS, testsets, bench_do_sampling, 'users/s'),
+    'pickup_cross_region_elements': ((3,), testsets, bench_pickup_cross_region_elements, 'users/s'),
+    'simulate': (WAYS, testsets, bench_simulate, 'users/s'),
+    'separate_simulate': ((3,), membership_of_size, bench_simulate_epochs, 'epochs/s'),
+}
+
+
+if __name__ == '__main__':
+    main()
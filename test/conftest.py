@@ -0,0 +1,24 @@
+import pytest
+
+from src.userlist_generator import generate_userlists
+
+# テスト用の userlist の生成条件 (3分割、2ワーカー、固定の種)
+PROBS = (0.1, 0.1, 0.1, 0.2, 0.2, 0.2, 0.1)
+USERS = 30000
+SAMPLING_RATE = 0.1
+
+
+def generate(base_dir, users: int = USERS, splits: int = 3, probs=PROBS, **options):
+    return generate_userlists(probs, users, SAMPLING_RATE, str(base_dir), splits, 2, seed=1, **options)
+
+
+def sizes3(n):
+    return n.size1, n.size2, n.size3, n.size12, n.size13, n.size23, n.size123
+
+
+# 既定の条件で一度だけ生成した userlist のディレクトリ (list{k}.tsv / sample{k}.tsv)
+@pytest.fixture(scope='session')
+def generated_userlists(tmp_path_factory):
+    base_dir = tmp_path_factory.mktemp('userlists')
+    generate(base_dir)
+    return base_dir
@@ -0,0 +1,18 @@
+import pytest
+
+from test.bench_sampling import CASES, print_results, run_case
+
+
+@pytest.mark.parametrize('name,ways', [(name, ways) for name, (ways_list, *_) in CASES.items() for ways in ways_list])
+def test_case_runs(name, ways):
+    result = run_case(name, ways, 2000, repeat=1)
+    assert result['case'] == name and result['ways'] == ways
+    assert 0 < result['seconds'] and 0 < result['throughput'] and 0 < result['peak_rss_mb']
+
+
+def test_regression_is_reported(capsys):
+    result = run_case('decompose', 3, 2000, repeat=1)
+    slower = dict(result, seconds=result['seconds'] * 2)
+    assert print_results([slower], [result], tolerance=0.2) == 1
+    assert 'REGRESSION' in capsys.readouterr().out
+    assert print_results([result], [slower], tolerance=0.2) == 0
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from src.sampling_simulator_util import decompose, decompose2, decompose3, generate_membership, membership_to_sets
+from test.conftest import PROBS, sizes3
+
+
+def set_decompose3(population1, population2, population3):
+    set1, set2, set3 = set(population1), set(population2), set(population3)
+    return (len(set1), len(set2), len(set3), len(set1 & set2), len(set1 & set3), len(set2 & set3),
+            len(set1 & set2 & set3))
+
+
+def test_generated_sets():
+    sets = membership_to_sets(generate_membership(PROBS, 50000, seed=1))
+    assert sizes3(decompose3(*sets)) == set_decompose3(*sets)
+
+
+@pytest.mark.parametrize('populations', [
+    ([1, 1, 2], [5], [7]),
+    ([1, 1, 2, 2], [1, 1], [2, 2, 9]),
+    (np.array([3, 3, 10 ** 12]), [10 ** 12, 10 ** 12], [3]),
+    (np.array([3, 3, 10 ** 12]), np.array([10 ** 12, 10 ** 12]), np.array([3])),
+    (np.array([1, 1, 2, 5]), np.array([2, 2]), np.array([], dtype=np.int64)),
+    (np.array(['a', 'b', 'b']), np.array(['b']), np.array(['a', 'c'])),
+    (np.array([1, 'a', None], dtype=object), np.array([None]), np.array([1])),
+    (['a', 'b', 'b'], {'b'}, ('a', 'c')),
+    ({(1, 2), (3, 4)}, {(1, 2)}, {(3, 4), (5, 6)}),
+    ({None, 1}, {None}, {1, 2}),
+    ({1, '1'}, {'1'}, {1}),
+    ([1.0, 2], {1}, {2.0, 3}),
+])
+def test_duplicates_and_element_types(populations):
+    assert sizes3(decompose3(*populations)) == set_decompose3(*populations)
+
+
+def test_two_and_n_lists():
+    n2 = decompose2([1, 1, 2], [1, 3])
+    assert (n2.size1, n2.size12, n2.size2) == (2, 1, 2)
+
+    rng = np.random.default_rng(2)
+    populations = [rng.integers(0, 1000, 800) for _ in range(4)]
+    sizes = decompose(*populations).sizes
+    for mask in range(1, 16):
+        members = set.intersection(*(set(populations[k].tolist()) for k in range(4) if mask >> k & 1))
+        assert sizes[mask] == len(members)
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from src.guid_generator import GUID_MODES, duplicated_indices, generate_guids, iter_guids
+from src.userlist_format import GUID_LENGTH
+
+
+@pytest.mark.parametrize('mode', GUID_MODES)
+def test_format(mode):
+    guids = generate_guids(1000, np.random.default_rng(1), mode, key=5)
+    assert guids.dtype == np.dtype(f'S{GUID_LENGTH}')
+    assert all(guid.isalnum() and guid.upper() == guid for guid in guids.tolist())
+
+
+def test_counter_is_unique_across_namespaces_and_chunks():
+    rng = np.random.default_rng(1)
+    guids = np.concatenate([chunk for namespace in range(4)
+                            for chunk in iter_guids(50000, rng, 'counter', 7, namespace, chunk_size=12345)])
+    assert len(np.unique(guids)) == len(guids)
+    assert np.array_equal(generate_guids(100, rng, 'counter', 7, 2, start=50),
+                          generate_guids(200, rng, 'counter', 7, 2)[50:150])
+
+
+def test_duplicated_indices():
+    guids = np.array([b'A', b'B', b'A', b'C', b'B', b'A'], dtype=f'S{GUID_LENGTH}')
+    assert duplicated_indices(guids).tolist() == [2, 4, 5]
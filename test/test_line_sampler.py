@@ -0,0 +1,29 @@
+import pytest
+
+from src.line_sampler import sample_lines
+
+
+@pytest.fixture
+def lines_file(tmp_path):
+    path = tmp_path / 'lines.tsv'
+    path.write_bytes(b''.join(f'guid{i}\t{i}\n'.encode() for i in range(1000)))
+    return path
+
+
+def test_exact_count_keeps_order(lines_file, tmp_path):
+    dest = tmp_path / 'sample.tsv'
+    assert sample_lines(lines_file, dest, 0.1, 1000, seed=1, block_size=256) == 100
+
+    sampled = dest.read_bytes().splitlines(keepends=True)
+    lines = lines_file.read_bytes().splitlines(keepends=True)
+    assert len(sampled) == 100
+    assert [lines.index(line) for line in sampled] == sorted(lines.index(line) for line in sampled)
+
+
+@pytest.mark.parametrize('block_size', [256, 1 << 22])
+@pytest.mark.parametrize('total_count', [500, 999, 1001])
+def test_wrong_total_count_is_rejected(lines_file, tmp_path, total_count, block_size):
+    dest = tmp_path / 'sample.tsv'
+    with pytest.raises(ValueError):
+        sample_lines(lines_file, dest, 0.1, total_count, seed=1, block_size=block_size)
+    assert list(tmp_path.iterdir()) == [lines_file]
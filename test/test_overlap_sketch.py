@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from src.overlap_sketch import HyperLogLog, KMVSketch, build_sketches, hash64, membership_lists, mix64, \
+    sketch_cardinality, sketch_intersection_sizes
+from src.sampling_simulator_util import decompose_membership, generate_membership
+
+SKETCHES = [
+    ('kmv', lambda: KMVSketch(4096), 4096),
+    ('hll', lambda: HyperLogLog(14), 1 << 14),
+]
+
+
+@pytest.fixture(scope='module')
+def membership():
+    return generate_membership((0.2, 0.15, 0.1, 0.15, 0.1, 0.1, 0.2), 200000, seed=1)
+
+
+def test_hash64():
+    values = np.arange(1000000, dtype=np.uint64)
+    assert len(np.unique(mix64(values))) == len(values)
+    assert np.array_equal(hash64(values, 3), hash64(values.astype(np.int64), 3))
+    assert not np.array_equal(hash64(values, 3), hash64(values, 4))
+
+    guids = np.array(['ABC', 'ABD', 'ABCDEFGHIJK', 'ABCDEFGHIJL'])
+    assert np.array_equal(hash64(guids), hash64(guids.astype('S11')))
+    assert len(np.unique(hash64(guids))) == len(guids)
+
+    # 上位ビットも一様であること (HyperLogLog はハッシュの上位ビットをレジスタの番号に使う)
+    buckets = np.bincount((hash64(values) >> np.uint64(56)).astype(np.int64), minlength=256)
+    assert buckets.min() > 0.9 * len(values) / 256 and buckets.max() < 1.1 * len(values) / 256
+
+
+@pytest.mark.parametrize('name,factory,size', SKETCHES)
+def test_overlap_estimates(membership, name, factory, size):
+    n = decompose_membership(membership, 3)
+    estimated = sketch_cardinality(build_sketches(membership_lists(membership, 3), factory, salt=5))
+
+    unions = np.zeros(8)
+    for mask in range(1, 8):
+        unions[mask] = np.count_nonzero(membership & mask)
+    for mask in (0b011, 0b101, 0b110, 0b111):
+        if name == 'kmv':
+            # 和集合の k 個の最小値のうち積集合に入る割合の二項誤差
+            share = n.sizes[mask] / unions[mask]
+            sigma = n.sizes[mask] * np.sqrt((1 - share) / (share * size))
+        else:
+            # 包除原理で足し引きする各和集合の推定誤差 (相対誤差 1.04 / √m)
+            subsets = [t for t in range(1, 8) if t & mask == t]
+            sigma = 1.04 / np.sqrt(size) * np.sqrt(np.sum(unions[subsets] ** 2))
+        assert abs(estimated.sizes[mask] - n.sizes[mask]) < 4 * sigma, mask
+
+
+@pytest.mark.parametrize('name,factory,size', SKETCHES)
+def test_union_equals_sketch_of_combined_input(name, factory, size):
+    rng = np.random.default_rng(2)
+    parts = [rng.integers(0, 10 ** 6, count) for count in (50000, 3000, 20000)]
+    sketches = build_sketches(parts, factory, salt=7)
+    combined = build_sketches([np.concatenate(parts)], factory, salt=7)[0]
+
+    union = sketches[0].union(*sketches[1:])
+    if name == 'kmv':
+        assert np.array_equal(union.values, combined.values)
+    else:
+        assert np.array_equal(union.registers, combined.registers)
+    assert union.estimate() == combined.estimate()
+
+
+def test_small_sets_are_exact_for_kmv():
+    sketches = build_sketches([np.arange(0, 100), np.arange(50, 120)], lambda: KMVSketch(256))
+    sizes = sketch_intersection_sizes(sketches)
+    assert sizes[0] == 120 and sizes[0b01] == 100 and sizes[0b10] == 70 and sizes[0b11] == 50
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from src.sampling_engine import draw_region_counts, sample_region_counts
+from src.sampling_simulator_util import decompose_membership, generate_membership, intersection_sizes, \
+    region_counts, region_sizes, subset_products
+from src.sampling_variance import CorrectionMoments
+
+EPOCHS = 2000
+RATES = np.array((0.1, 0.3, 0.5))
+
+
+@pytest.fixture(scope='module')
+def membership():
+    return generate_membership((0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.4), 20000, seed=1)
+
+
+def corrected_counts(counts: np.ndarray) -> np.ndarray:
+    sampled = intersection_sizes(counts, 3)
+    return region_sizes(sampled / subset_products(RATES, 3), 3)[:, 1:]
+
+
+@pytest.mark.parametrize('bernoulli', [False, True])
+@pytest.mark.parametrize('engine', ['population', 'drawn'])
+def test_moments_match_monte_carlo(membership, engine, bernoulli):
+    moments = CorrectionMoments(decompose_membership(membership, 3), RATES, bernoulli)
+    if engine == 'population':
+        counts = sample_region_counts(membership, 3, RATES, EPOCHS, bernoulli=bernoulli, seed=2)
+    else:
+        counts = draw_region_counts(region_counts(membership, 3), 3, RATES, EPOCHS, bernoulli=bernoulli, seed=2)
+    corrected = corrected_counts(counts)
+
+    std = moments.std()
+    assert np.all(np.abs(corrected.mean(axis=0) - moments.mean) < 5 * std / np.sqrt(EPOCHS))
+    assert np.allclose(corrected.std(axis=0, ddof=1), std, rtol=0.1)
+
+
+def test_confidence_interval_coverage(membership):
+    moments = CorrectionMoments(decompose_membership(membership, 3), RATES)
+    corrected = corrected_counts(sample_region_counts(membership, 3, RATES, EPOCHS, seed=3))
+
+    lower, upper = moments.confidence_interval(0.95)
+    coverage = ((lower <= corrected) & (corrected <= upper)).mean(axis=0)
+    assert np.all(np.abs(coverage - 0.95) < 0.02)
@@ -0,0 +1,56 @@
+import json
+import os
+import subprocess
+import sys
+from os.path import dirname
+
+import pytest
+
+ROOT = dirname(dirname(os.path.abspath(__file__)))
+
+SCRIPT = '''
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+from src.sampling_engine import sample_region_counts
+from src.sampling_simulator_util import generate_membership
+
+if __name__ == '__main__':
+    multiprocessing.set_start_method(sys.argv[1])
+    membership = generate_membership((0.1, 0.1, 0.1, 0.2, 0.2, 0.2, 0.1), 10000, seed=1)
+    counts = sample_region_counts(membership, 3, (0.1, 0.2, 0.3), 40, batch_size=5, max_workers=2, seed=2)
+    print(os.environ['SAMPLING_STAGE_TIMER_DIR'])
+    print(len(counts))
+'''
+
+
+@pytest.mark.parametrize('start_method', ['fork', 'spawn'])
+def test_worker_stages_are_collected(tmp_path, start_method):
+    script = tmp_path / 'run.py'
+    script.write_text(SCRIPT)
+    output = tmp_path / 'stages.json'
+    env = dict(os.environ, SAMPLING_STAGE_TIMER=str(output), PYTHONPATH=ROOT)
+    for name in ('SAMPLING_STAGE_TIMER_DIR', 'SAMPLING_STAGE_TIMER_OWNER'):
+        env.pop(name, None)
+
+    result = subprocess.run([sys.executable, str(script), start_method], env=env, capture_output=True, text=True,
+                            check=True)
+    stage_dir, epochs = result.stdout.split()
+    assert epochs == '40'
+
+    stats = json.loads(output.read_text())
+    # 8 バッチはすべてワーカーで実行され、その集計が親プロセスの JSON に入る
+    assert stats['sampling_engine.sample_batch']['calls'] == 8
+    assert 0 < stats['sampling_engine.sample_batch']['wall_seconds']
+    assert not os.path.exists(stage_dir)
+
+
+def test_disabled_without_setting(tmp_path):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop('SAMPLING_STAGE_TIMER', None)
+    code = 'from src.sampling_engine import sample_batch; print(hasattr(sample_batch, "__wrapped__"))'
+    assert subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True,
+                          check=True).stdout.strip() == 'False'
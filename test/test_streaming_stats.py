@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from src.streaming_stats import StreamingStats, TDigest
+
+QUANTILES = (0.1, 1, 2.5, 25, 50, 75, 97.5, 99, 99.9)
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(1)
+    return np.column_stack((rng.normal(10, 3, 100000), rng.exponential(2, 100000), rng.integers(0, 50, 100000)))
+
+
+def rank_errors(values: np.ndarray, estimates, quantiles) -> np.ndarray:
+    ordered = np.sort(values)
+    ranks = np.searchsorted(ordered, estimates, side='right') / len(ordered)
+    return np.abs(ranks - np.asarray(quantiles) / 100)
+
+
+def test_split_and_merge_matches_single_accumulator(data):
+    single = StreamingStats(3)
+    for batch in np.array_split(data, 37):
+        single.update(batch)
+
+    merged = StreamingStats(3)
+    for part in np.array_split(data, 5):
+        worker = StreamingStats(3)
+        for batch in np.array_split(part, 7):
+            worker.update(batch)
+        merged.merge(worker)
+    merged.merge(StreamingStats(3))
+
+    assert merged.count == single.count == len(data)
+    assert np.allclose(merged.mean, data.mean(axis=0))
+    assert np.allclose(merged.variance(), data.var(axis=0, ddof=1))
+    assert np.allclose(merged.mean, single.mean) and np.allclose(merged.variance(), single.variance())
+    for q in QUANTILES:
+        spread = data.max(axis=0) - data.min(axis=0)
+        assert np.all(np.abs(merged.percentile(q) - single.percentile(q)) <= 0.01 * spread)
+
+
+@pytest.mark.parametrize('column', [0, 1])
+def test_tdigest_quantiles_match_percentile(data, column):
+    values = data[:, column]
+    digest = TDigest()
+    for batch in np.array_split(values, 23):
+        digest.update(batch)
+
+    estimates = [digest.quantile(q / 100) for q in QUANTILES]
+    assert np.all(rank_errors(values, estimates, QUANTILES) < 0.002)
+    # 裾の外側 (0.1%, 99.9%) は重心がまばらなので、値ではなく順位の誤差だけを見る
+    central = slice(1, -1)
+    assert np.allclose(estimates[central], np.percentile(values, QUANTILES[central]), rtol=0, atol=0.02 * values.std())
+    assert digest.total_weight == len(values) and len(digest.means) < 400
+
+
+def test_merged_tdigests_match_percentile(data):
+    values = data[:, 1]
+    digest = TDigest()
+    for part in np.array_split(values, 8):
+        worker = TDigest()
+        worker.update(part)
+        digest.merge(worker)
+
+    estimates = [digest.quantile(q / 100) for q in QUANTILES]
+    assert np.all(rank_errors(values, estimates, QUANTILES) < 0.002)
+    assert (digest.min, digest.max) == (values.min(), values.max())
+
+
+def test_empty():
+    stats = StreamingStats(2)
+    stats.update(np.zeros((0, 2)))
+    assert stats.count == 0 and np.all(np.isnan(stats.variance())) and np.all(np.isnan(stats.percentile(50)))
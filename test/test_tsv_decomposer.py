@@ -0,0 +1,38 @@
+import pytest
+
+from src.sampling_simulator_util import decompose3
+from src.tsv_decomposer import decompose_files, decompose_files3
+from src.userlist_format import tsv_to_userlist
+from test.conftest import sizes3
+
+
+@pytest.fixture
+def userlists(generated_userlists):
+    return [str(generated_userlists / f'list{k}.tsv') for k in range(1, 4)]
+
+
+def read_guids(path):
+    with open(path) as src:
+        return [line.split('\t', 1)[0] for line in src]
+
+
+@pytest.mark.parametrize('buckets,max_workers', [(1, 1), (7, 1), (5, 2)])
+def test_matches_decompose3(userlists, tmp_path, buckets, max_workers):
+    expected = decompose3(*(read_guids(path) for path in userlists))
+    assert sizes3(decompose_files3(userlists, str(tmp_path), buckets, max_workers)) == sizes3(expected)
+    assert not list(tmp_path.iterdir())
+
+
+def test_small_chunks(userlists, tmp_path):
+    expected = decompose3(*(read_guids(path) for path in userlists))
+    sizes = decompose_files(userlists, str(tmp_path), 3, chunk_lines=1000).sizes
+    assert tuple(sizes[[1, 2, 4, 3, 5, 6, 7]].tolist()) == sizes3(expected)
+
+
+def test_binary_userlists(userlists, tmp_path):
+    binary_lists = [str(tmp_path / f'list{k}.npy') for k in range(1, 4)]
+    for path, binary_path in zip(userlists, binary_lists):
+        tsv_to_userlist(path, binary_path)
+
+    expected = decompose3(*(read_guids(path) for path in userlists))
+    assert sizes3(decompose_files3(binary_lists, str(tmp_path), 4)) == sizes3(expected)
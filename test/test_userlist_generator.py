@@ -0,0 +1,27 @@
+import pytest
+
+from test.conftest import PROBS, generate
+
+
+def test_phase_metrics(tmp_path):
+    metrics = generate(tmp_path)
+    phases = ['generate'] + [f'{phase} list{k}' for phase in ('merge', 'sample') for k in range(1, 4)]
+    assert sorted(metrics) == sorted(phases)
+
+    tasks, started, finished, busy, rows, written = metrics['generate']
+    assert (tasks, rows) == (3, 30000) and started < finished and 0 < busy and 0 < written
+    for k in range(1, 4):
+        _, merge_started, merge_finished, _, merged, _ = metrics[f'merge list{k}']
+        _, sample_started, _, _, sampled, written = metrics[f'sample list{k}']
+        assert finished <= merge_started < merge_finished <= sample_started
+        assert sampled == round(0.1 * merged)
+        assert written == (tmp_path / f'sample{k}.tsv').stat().st_size
+
+
+def test_worker_failure_keeps_work_files(tmp_path):
+    # 負の確率はワーカーの中で generate_membership が ValueError を送出する
+    with pytest.raises(RuntimeError, match='generate failed') as error:
+        generate(tmp_path, 3000, 2, (-0.1,) + PROBS[1:])
+    assert isinstance(error.value.__cause__, ValueError)
+    assert (tmp_path / 'work').is_dir()
+    assert not (tmp_path / 'list1.tsv').exists()
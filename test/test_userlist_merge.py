@@ -0,0 +1,118 @@
+import filecmp
+
+import numpy as np
+import pytest
+
+from src.userlist_format import SCORE_LABELS, open_userlist, tsv_to_userlist, userlist_to_tsv
+from src.userlist_generator import merge_file, merge_list, save_guid_sets, score_key, spill_runs, work_files
+from test.conftest import PROBS, generate
+
+
+def write_sorted(path, rng, size):
+    scores = np.sort(rng.integers(0, 40, size))[::-1]
+    path.write_bytes(b''.join(b'guid%d\t%s\n' % (i, SCORE_LABELS[score]) for i, score in enumerate(scores)))
+    return str(path)
+
+
+@pytest.fixture
+def sorted_files(tmp_path):
+    rng = np.random.default_rng(1)
+    return [write_sorted(tmp_path / f'in{i}.tsv', rng, size) for i, size in enumerate((3000, 0, 5000, 1))]
+
+
+def stable_merge(input_files):
+    lines = [line for file in input_files for line in open(file)]
+    return ''.join(sorted(lines, key=score_key, reverse=True))
+
+
+@pytest.mark.parametrize('partitions', [1, 3])
+def test_merge_file_is_stable(sorted_files, tmp_path, partitions):
+    dest = tmp_path / 'merged.tsv'
+    assert merge_file(sorted_files, str(dest), score_key, reverse=True, partitions=partitions,
+                      max_workers=partitions) == 8001
+    assert dest.read_text() == stable_merge(sorted_files)
+
+
+def assert_same_userlists(dir1, dir2, ext='tsv'):
+    for k in range(1, 4):
+        for name in (f'list{k}.{ext}', f'sample{k}.{ext}'):
+            assert filecmp.cmp(dir1 / name, dir2 / name, shallow=False), name
+
+
+def generated(base_dir, **options):
+    generate(base_dir, **options)
+    return base_dir
+
+
+def test_partitioned_merge_matches_heap_merge(generated_userlists, tmp_path):
+    assert_same_userlists(generated_userlists, generated(tmp_path, merge_partitions=3))
+
+
+def test_heap_merge_output(generated_userlists):
+    assert not (generated_userlists / 'work').exists()
+    for k in range(1, 4):
+        scores = [score_key(line) for line in open(generated_userlists / f'list{k}.tsv')]
+        assert scores == sorted(scores, reverse=True)
+        assert len(open(generated_userlists / f'sample{k}.tsv').readlines()) == round(0.1 * len(scores))
+
+
+@pytest.mark.parametrize('partitions', [1, 3])
+def test_bucketed_concat_matches_heap_merge(generated_userlists, tmp_path, partitions):
+    assert_same_userlists(generated_userlists, generated(tmp_path, bucketed=True, merge_partitions=partitions))
+
+
+def test_binary_userlists_match_tsv(generated_userlists, tmp_path):
+    binary = generated(tmp_path / 'binary', binary=True)
+    for k in range(1, 4):
+        for name in (f'list{k}', f'sample{k}'):
+            records = userlist_to_tsv(str(binary / f'{name}.npy'), str(tmp_path / f'{name}.tsv'))
+            assert filecmp.cmp(generated_userlists / f'{name}.tsv', tmp_path / f'{name}.tsv', shallow=False), name
+            assert records == len(open_userlist(str(binary / f'{name}.npy')))
+
+
+def test_tsv_round_trip(generated_userlists, tmp_path):
+    assert tsv_to_userlist(str(generated_userlists / 'list1.tsv'), str(tmp_path / 'list1.npy')) == \
+        userlist_to_tsv(str(tmp_path / 'list1.npy'), str(tmp_path / 'list1.tsv'))
+    assert filecmp.cmp(generated_userlists / 'list1.tsv', tmp_path / 'list1.tsv', shallow=False)
+
+
+@pytest.fixture(scope='module')
+def spilled(tmp_path_factory):
+    base_dir = tmp_path_factory.mktemp('spilled')
+    for task_id in range(2):
+        for bucketed, binary in ((True, False), (False, True)):
+            save_guid_sets(PROBS, 10000, task_id, str(base_dir), task_id, bucketed, binary, 'counter', 7,
+                           chunk_users=3000)
+    return base_dir
+
+
+def test_runs_merge_in_split_and_run_order(spilled, tmp_path):
+    runs = spill_runs(10000, 3000)
+    assert runs == 4
+    for k in range(1, 4):
+        input_files = work_files(str(spilled), [k], range(2), runs)
+        expected = stable_merge(input_files)
+        guids = [line.split('\t', 1)[0] for line in expected.splitlines()]
+        assert len(set(guids)) == len(guids)
+
+        for bucketed in (False, True):
+            assert merge_list(k, str(spilled), 2, 1, bucketed, False, runs) == len(guids)
+            assert (spilled / f'list{k}.tsv').read_text() == expected
+
+        merge_list(k, str(spilled), 2, 1, False, True, runs)
+        userlist_to_tsv(str(spilled / f'list{k}.npy'), str(tmp_path / 'binary.tsv'))
+        assert (tmp_path / 'binary.tsv').read_text() == expected
+
+
+@pytest.mark.parametrize('options', [{}, {'bucketed': True}, {'merge_partitions': 3}])
+def test_memory_budget_modes_agree(tmp_path, options):
+    reference = generated(tmp_path / 'reference', memory_budget=1 << 20)
+    assert_same_userlists(reference, generated(tmp_path / 'other', memory_budget=1 << 20, **options))
+
+
+def test_oversized_guid_is_rejected(tmp_path):
+    src = tmp_path / 'long.tsv'
+    src.write_bytes(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123\t0.5\nABCDEFGHIJKLMNOPQRSTUVWXYZ9999\t0.5\n')
+    with pytest.raises(ValueError, match='longer than 26'):
+        tsv_to_userlist(str(src), str(tmp_path / 'long.npy'))
+    assert not (tmp_path / 'long.npy').exists()